@@ -1,9 +1,11 @@
 import random
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import sqlite3
 
+from entity_matcher import EntityMatcher, transliterate
+
 class AdvancedContentGenerator:
     """Продвинутый генератор контента в стиле Матч ТВ"""
     
@@ -216,35 +218,40 @@ class AdvancedContentGenerator:
                 "founded": 1957,
                 "colors": "синий, белый",
                 "nickname": "Лидер",
-                "achievements": ["14 титулов чемпиона", "4 Кубка Азии"]
+                "achievements": ["14 титулов чемпиона", "4 Кубка Азии"],
+                "aliases": ["Al-Hilal", "Хиляль", "الهلال"]
             },
             "Аль-Насср": {
                 "stadium": "Стадион Мрсул Парк",
                 "founded": 1955,
                 "colors": "желтый, синий",
                 "nickname": "Глобальный",
-                "achievements": ["9 титулов чемпиона", "6 Кубков Короля"]
+                "achievements": ["9 титулов чемпиона", "6 Кубков Короля"],
+                "aliases": ["Al-Nassr", "Насср", "النصر"]
             },
             "Аль-Ахли": {
                 "stadium": "Стадион Принца Абдуллы аль-Фейсала",
                 "founded": 1937,
                 "colors": "зеленый, белый",
                 "nickname": "Рыцари Неджда",
-                "achievements": ["3 титула чемпиона", "13 Кубков Короля"]
+                "achievements": ["3 титула чемпиона", "13 Кубков Короля"],
+                "aliases": ["Al-Ahli", "Ахли", "الأهلي"]
             },
             "Аль-Иттихад": {
                 "stadium": "Стадион Короля Абдуллы",
                 "founded": 1927,
                 "colors": "желтый, черный",
                 "nickname": "Тигры",
-                "achievements": ["8 титулов чемпиона", "2 Кубка Азии"]
+                "achievements": ["8 титулов чемпиона", "2 Кубка Азии"],
+                "aliases": ["Al-Ittihad", "Иттихад", "الاتحاد"]
             },
             "Аль-Шабаб": {
                 "stadium": "Стадион Принца Фейсала бин Фахда",
                 "founded": 1947,
                 "colors": "белый, черный",
                 "nickname": "Белые",
-                "achievements": ["6 титулов чемпиона", "5 Кубков Короля"]
+                "achievements": ["6 титулов чемпиона", "5 Кубков Короля"],
+                "aliases": ["Al-Shabab", "Шабаб", "الشباب"]
             }
         }
         
@@ -255,7 +262,8 @@ class AdvancedContentGenerator:
                 "age": 39,
                 "nationality": "Португалия",
                 "goals_season": random.randint(15, 25),
-                "assists_season": random.randint(3, 8)
+                "assists_season": random.randint(3, 8),
+                "aliases": ["Cristiano Ronaldo", "Роналду", "CR7"]
             },
             "Карим Бензема": {
                 "team": "Аль-Иттихад",
@@ -263,7 +271,8 @@ class AdvancedContentGenerator:
                 "age": 36,
                 "nationality": "Франция",
                 "goals_season": random.randint(12, 20),
-                "assists_season": random.randint(5, 10)
+                "assists_season": random.randint(5, 10),
+                "aliases": ["Karim Benzema", "Бензема"]
             },
             "Н'Голо Канте": {
                 "team": "Аль-Иттихад",
@@ -271,7 +280,8 @@ class AdvancedContentGenerator:
                 "age": 33,
                 "nationality": "Франция",
                 "goals_season": random.randint(2, 5),
-                "assists_season": random.randint(4, 8)
+                "assists_season": random.randint(4, 8),
+                "aliases": ["N'Golo Kanté", "N'Golo Kante", "Канте"]
             },
             "Рияд Махрез": {
                 "team": "Аль-Ахли",
@@ -279,9 +289,38 @@ class AdvancedContentGenerator:
                 "age": 33,
                 "nationality": "Алжир",
                 "goals_season": random.randint(8, 15),
-                "assists_season": random.randint(6, 12)
+                "assists_season": random.randint(6, 12),
+                "aliases": ["Riyad Mahrez", "Махрез"]
             }
         }
+        
+        # Автомат поиска упоминаний строится лениво и кэшируется до invalidate_entity_matcher()
+        self._entity_matcher = None
+    
+    def get_entity_matcher(self) -> EntityMatcher:
+        """Автомат поиска упоминаний команд и игроков, построенный один раз"""
+        if self._entity_matcher is None:
+            self._entity_matcher = EntityMatcher(self._build_entity_patterns())
+        return self._entity_matcher
+        
+    def invalidate_entity_matcher(self):
+        """Сброс автомата; вызывается после изменения saudi_teams или player_database"""
+        self._entity_matcher = None
+    
+    def find_mentioned_entities(self, text: str) -> List[Tuple[str, str]]:
+        """Упомянутые в тексте команды и игроки: [(название, 'team'|'player'), ...]"""
+        return self.get_entity_matcher().find(text)
+    
+    def _build_entity_patterns(self) -> Dict[str, Tuple[str, str]]:
+        """Все написания сущностей: название, псевдонимы и транслитерация"""
+        patterns = {}
+        
+        for entity_type, entities in (('team', self.saudi_teams), ('player', self.player_database)):
+            for name, data in entities.items():
+                for alias in [name, transliterate(name)] + list(data.get('aliases', [])):
+                    patterns.setdefault(alias, (name, entity_type))
+        
+        return patterns
 
     def generate_detailed_match_preview(self, match_data: Dict) -> str:
         """Генерация детального превью матча"""
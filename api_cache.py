@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from error_handler import CircuitOpenError
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+class ApiCache:
+    """Двухуровневый кэш ответов API: LRU в памяти перед таблицей api_cache
+    
+    Ответ свежий ttl_minutes, после этого и до hard_ttl_minutes он
+    устаревший: отдается сразу, а в фоне запускается обновление
+    (stale-while-revalidate). Горячие ключи читаются из памяти без обращения
+    к БД, и запрос ждет внешний API только если ответа нет ни в памяти,
+    ни в БД. Память ограничена числом записей и суммарным размером JSON.
+    
+    loader получает валидаторы текущего ответа ({'etag', 'last_modified'},
+    пустой словарь при промахе) и возвращает новый ответ
+    {'data', 'etag', 'last_modified'} или None, если ответ не изменился
+    (304 Not Modified). Тогда у записи только продлевается срок жизни,
+    JSON заново не разбирается и не сериализуется.
+    """
+    
+    def __init__(self, async_db, max_entries: int = 256, max_bytes: int = 8 * 1024 * 1024):
+        self.async_db = async_db
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, str], Dict]' = OrderedDict()
+        self._bytes = 0
+        self._flights = SingleFlight()
+        self._refreshing: Set[asyncio.Task] = set()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0, 'stale': 0,
+                       'refreshes': 0, 'not_modified': 0, 'refresh_errors': 0, 'evictions': 0}
+    
+    async def get(self, endpoint: str, params: str, loader: Callable[[Dict], Awaitable[Optional[Dict]]],
+                  ttl_minutes: int, hard_ttl_minutes: Optional[int] = None) -> Any:
+        """Ответ для endpoint и params: из памяти, из БД или от loader()"""
+        data, _ = await self.get_versioned(endpoint, params, loader, ttl_minutes, hard_ttl_minutes)
+        return data
+    
+    async def get_versioned(self, endpoint: str, params: str,
+                            loader: Callable[[Dict], Awaitable[Optional[Dict]]],
+                            ttl_minutes: int, hard_ttl_minutes: Optional[int] = None) -> Tuple[Any, Optional[int]]:
+        """Ответ и его версия (id записи в api_cache, None - если записать не удалось)
+        
+        Версия меняется, только когда API прислал новое тело ответа: попадания
+        в кэш и 304 Not Modified возвращают прежнюю.
+        """
+        key = (endpoint, params)
+        now = datetime.now()
+        
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires_at'] <= now:
+            self._remove(key)
+            entry = None
+        
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        else:
+            entry = await self._flights.do(('disk', key), lambda: self._read_disk(key))
+            if entry is None:
+                # Промах - это запрос к API; остальные ждут его результат
+                if self._flights.is_running(key):
+                    self._stats['coalesced'] += 1
+                else:
+                    self._stats['misses'] += 1
+                entry = await self._flights.do(
+                    key, lambda: self._load(key, loader, ttl_minutes, hard_ttl_minutes)
+                )
+                return entry['data'], entry.get('version')
+            self._stats['disk_hits'] += 1
+        
+        if entry['fresh_until'] <= now:
+            self._stats['stale'] += 1
+            self._refresh(key, loader, ttl_minutes, hard_ttl_minutes)
+        return entry['data'], entry.get('version')
+    
+    async def _read_disk(self, key: Tuple[str, str]) -> Optional[Dict]:
+        """Чтение из api_cache с переносом записи в память"""
+        entry = await self.async_db.get_api_cache_entry(*key)
+        if entry is not None:
+            self._put(key, entry)
+        return entry
+    
+    async def _load(self, key: Tuple[str, str], loader: Callable[[Dict], Awaitable[Optional[Dict]]],
+                    ttl_minutes: int, hard_ttl_minutes: Optional[int]) -> Dict:
+        """Запрос к API (условный, если ответ уже есть) и запись в оба уровня кэша"""
+        current = self._entries.get(key)
+        validators = {}
+        if current is not None:
+            validators = {'etag': current.get('etag'), 'last_modified': current.get('last_modified')}
+        
+        response = await loader(validators)
+        now = datetime.now()
+        fresh_until = now + timedelta(minutes=ttl_minutes)
+        expires_at = now + timedelta(minutes=max(ttl_minutes, hard_ttl_minutes or ttl_minutes))
+        
+        if response is None and current is not None:
+            self._stats['not_modified'] += 1
+            entry = dict(current, fresh_until=fresh_until, expires_at=expires_at)
+            self._put(key, entry)
+            await self.async_db.touch_api_cache(key[0], key[1], ttl_minutes, hard_ttl_minutes)
+            return entry
+        
+        data = response['data']
+        version = await self.async_db.save_api_cache(key[0], key[1], data, ttl_minutes, hard_ttl_minutes,
+                                                     response.get('etag'), response.get('last_modified'))
+        entry = {
+            'data': data,
+            'fresh_until': fresh_until,
+            'expires_at': expires_at,
+            'size': len(json.dumps(data)),
+            'etag': response.get('etag'),
+            'last_modified': response.get('last_modified'),
+            'version': version
+        }
+        self._put(key, entry)
+        return entry
+    
+    def _refresh(self, key: Tuple[str, str], loader: Callable[[Dict], Awaitable[Optional[Dict]]],
+                 ttl_minutes: int, hard_ttl_minutes: Optional[int]):
+        """Фоновое обновление устаревшего ответа, не больше одного на ключ"""
+        async def refresh():
+            try:
+                await self._flights.do(key, lambda: self._load(key, loader, ttl_minutes, hard_ttl_minutes))
+                self._stats['refreshes'] += 1
+            except CircuitOpenError:
+                # Сервис недоступен: продолжаем отдавать устаревший ответ
+                self._stats['refresh_errors'] += 1
+            except Exception as e:
+                self._stats['refresh_errors'] += 1
+                logger.warning(f"⚠️ Не удалось обновить кэш {key[0]}: {e}")
+        
+        task = asyncio.create_task(refresh())
+        # Ссылка на задачу, чтобы сборщик мусора не отменил ее до завершения
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+    
+    def _put(self, key: Tuple[str, str], entry: Dict):
+        """Запись в память с вытеснением самых старых записей сверх лимитов"""
+        if entry['size'] > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry['size']
+        
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats['evictions'] += 1
+    
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
+    
+    def invalidate(self, endpoint: Optional[str] = None):
+        """Сброс памяти для эндпоинта или целиком (БД не затрагивается)"""
+        for key in [key for key in self._entries if endpoint is None or key[0] == endpoint]:
+            self._remove(key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий, промахов и устаревших ответов
+        
+        misses - запросы к API из-за промаха, coalesced - промахи, которые
+        дождались уже идущего запроса с тем же ключом.
+        """
+        stats = self._stats
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses'] + stats['coalesced']
+        return dict(
+            stats,
+            entries=len(self._entries),
+            bytes=self._bytes,
+            hit_rate=round((stats['hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        )
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabaseManager:
+    """Асинхронный фасад над DatabaseManager и пользовательскими данными InteractiveHandler
+    
+    Все синхронные вызовы sqlite3 выполняются в выделенном потоке, поэтому
+    медленная запись (например, ожидание 'database is locked') не блокирует
+    цикл событий и обработку остальных обновлений Telegram.
+    """
+    
+    def __init__(self, db_manager=None, interactive_handler=None, max_workers: int = 1):
+        self.db_manager = db_manager
+        self.interactive_handler = interactive_handler
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение синхронной функции в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+    
+    def close(self):
+        """Остановка потока БД с ожиданием уже поставленных запросов"""
+        self._executor.shutdown(wait=True)
+        logger.info("🔒 Поток асинхронной БД остановлен")
+    
+    # Методы DatabaseManager
+    
+    async def save_team(self, team_data: Dict) -> bool:
+        return await self.run(self.db_manager.save_team, team_data)
+    
+    async def save_match(self, match_data: Dict) -> bool:
+        return await self.run(self.db_manager.save_match, match_data)
+    
+    async def save_matches_bulk(self, matches: Iterable[Dict]) -> Dict[str, int]:
+        return await self.run(self.db_manager.save_matches_bulk, matches)
+    
+    async def save_teams_bulk(self, teams: Iterable[Dict]) -> Dict[str, int]:
+        return await self.run(self.db_manager.save_teams_bulk, teams)
+    
+    async def save_players_bulk(self, players: Iterable[Dict]) -> Dict[str, int]:
+        return await self.run(self.db_manager.save_players_bulk, players)
+    
+    async def save_standings_bulk(self, standings: Iterable[Dict], league: str = 'Saudi Pro League',
+                                  season: str = None) -> Dict[str, int]:
+        return await self.run(self.db_manager.save_standings_bulk, standings, league, season)
+    
+    async def save_news_advanced(self, news_data: Dict) -> bool:
+        return await self.run(self.db_manager.save_news_advanced, news_data)
+    
+    async def save_post(self, content: str, post_type: str) -> bool:
+        return await self.run(self.db_manager.save_post, content, post_type)
+    
+    async def get_unpublished_news(self, news_type: str = None, limit: int = 5) -> List[Dict]:
+        return await self.run(self.db_manager.get_unpublished_news, news_type, limit)
+    
+    async def mark_news_published(self, news_id: int):
+        return await self.run(self.db_manager.mark_news_published, news_id)
+    
+    async def save_api_cache(self, endpoint: str, params: str, response_data: Any, ttl_minutes: int = 60,
+                             hard_ttl_minutes: Optional[int] = None, etag: Optional[str] = None,
+                             last_modified: Optional[str] = None) -> Optional[int]:
+        return await self.run(self.db_manager.save_api_cache, endpoint, params, response_data, ttl_minutes,
+                              hard_ttl_minutes, etag, last_modified)
+    
+    async def touch_api_cache(self, endpoint: str, params: str, ttl_minutes: int = 60,
+                              hard_ttl_minutes: Optional[int] = None) -> bool:
+        return await self.run(self.db_manager.touch_api_cache, endpoint, params, ttl_minutes, hard_ttl_minutes)
+    
+    async def get_api_cache(self, endpoint: str, params: str) -> Optional[Any]:
+        return await self.run(self.db_manager.get_api_cache, endpoint, params)
+    
+    async def get_api_cache_entry(self, endpoint: str, params: str) -> Optional[Dict]:
+        return await self.run(self.db_manager.get_api_cache_entry, endpoint, params)
+    
+    async def clean_old_cache(self):
+        return await self.run(self.db_manager.clean_old_cache)
+    
+    async def save_bot_stat(self, stat_type: str, stat_value: str):
+        return await self.run(self.db_manager.save_bot_stat, stat_type, stat_value)
+    
+    async def get_today_matches(self) -> List[Dict]:
+        return await self.run(self.db_manager.get_today_matches)
+    
+    async def get_match_kickoffs(self, start: datetime, end: datetime) -> List[datetime]:
+        return await self.run(self.db_manager.get_match_kickoffs, start, end)
+    
+    async def get_league_standings(self, league: str = 'Saudi Pro League', season: str = None) -> List[Dict]:
+        return await self.run(self.db_manager.get_league_standings, league, season)
+    
+    async def enqueue_outbox(self, messages: Iterable[Dict]) -> int:
+        return await self.run(self.db_manager.enqueue_outbox, messages)
+    
+    async def claim_outbox_batch(self, limit: int = 100) -> List[Dict]:
+        return await self.run(self.db_manager.claim_outbox_batch, limit)
+    
+    async def mark_outbox_sending(self, outbox_id: int):
+        return await self.run(self.db_manager.mark_outbox_sending, outbox_id)
+    
+    async def mark_outbox_sent(self, outbox_id: int):
+        return await self.run(self.db_manager.mark_outbox_sent, outbox_id)
+    
+    async def mark_outbox_failed(self, outbox_id: int, error: str, retry_at: Optional[datetime] = None):
+        return await self.run(self.db_manager.mark_outbox_failed, outbox_id, error, retry_at)
+    
+    async def recover_outbox(self) -> Dict[str, int]:
+        return await self.run(self.db_manager.recover_outbox)
+    
+    async def get_outbox_stats(self) -> Dict[str, int]:
+        return await self.run(self.db_manager.get_outbox_stats)
+    
+    async def get_image_file_id(self, image_hash: str) -> Optional[str]:
+        return await self.run(self.db_manager.get_image_file_id, image_hash)
+    
+    async def save_image_file_id(self, image_hash: str, file_id: str):
+        return await self.run(self.db_manager.save_image_file_id, image_hash, file_id)
+    
+    async def delete_image_file_id(self, image_hash: str):
+        return await self.run(self.db_manager.delete_image_file_id, image_hash)
+    
+    async def save_job_run(self, job_name: str, started_at: datetime, status: str):
+        return await self.run(self.db_manager.save_job_run, job_name, started_at, status)
+    
+    async def get_job_last_runs(self) -> Dict[str, datetime]:
+        return await self.run(self.db_manager.get_job_last_runs)
+    
+    async def get_database_stats(self) -> Dict:
+        return await self.run(self.db_manager.get_database_stats)
+    
+    async def ping(self) -> bool:
+        return await self.run(self.db_manager.ping)
+    
+    # Пользовательские данные InteractiveHandler
+    
+    async def register_user(self, user_id: int):
+        return await self.run(self.interactive_handler._register_user, user_id)
+    
+    async def add_user_subscription(self, user_id: int, entity_name: str, entity_type: str) -> bool:
+        return await self.run(self.interactive_handler._add_user_subscription, user_id, entity_name, entity_type)
+    
+    async def remove_user_subscription(self, user_id: int, entity_name: str, entity_type: str) -> bool:
+        return await self.run(self.interactive_handler._remove_user_subscription, user_id, entity_name, entity_type)
+    
+    async def check_user_subscription(self, user_id: int, entity_name: str, entity_type: str) -> bool:
+        return await self.run(self.interactive_handler._check_user_subscription, user_id, entity_name, entity_type)
+    
+    async def get_user_subscriptions(self, user_id: int) -> List[Dict]:
+        return await self.run(self.interactive_handler._get_user_subscriptions, user_id)
+    
+    async def get_user_settings(self, user_id: int) -> Dict:
+        return await self.run(self.interactive_handler._get_user_settings, user_id)
+    
+    async def get_subscribed_users(self, entity_name: str, entity_type: str) -> List[int]:
+        return await self.run(self.interactive_handler.get_subscribed_users, entity_name, entity_type)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SEND_SECONDS = REGISTRY.histogram('bot_send_latency_seconds', 'Время запроса send_message к Telegram')
+NOTIFICATIONS_SENT = REGISTRY.counter('bot_notifications_sent_total', 'Доставленные сообщения рассылки')
+NOTIFICATIONS_FAILED = REGISTRY.counter('bot_notifications_failed_total', 'Недоставленные сообщения рассылки')
+BROADCAST_THROUGHPUT = REGISTRY.gauge('bot_broadcast_throughput', 'Скорость последней рассылки (сообщ./с)')
+
+class TokenBucket:
+    """Ограничитель частоты 'ведро токенов' для asyncio"""
+    
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def pause(self, seconds: float):
+        """Приостановка ведра (например, после RetryAfter от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+    
+    def is_idle(self) -> bool:
+        """Ведро полное и не на паузе - его можно забыть"""
+        now = time.monotonic()
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
+    
+    async def acquire(self):
+        """Ожидание и получение одного токена"""
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class BroadcastEngine:
+    """Конкурентная рассылка сообщений с учетом лимитов Telegram
+    
+    Число одновременных запросов ограничено max_in_flight, общий поток -
+    глобальным ведром (~30 сообщений/с), а каждый чат - своим ведром
+    (~1 сообщение/с). RetryAfter приостанавливает только ведро того чата,
+    для которого пришел ответ, остальные получатели продолжают получать
+    сообщения.
+    """
+    
+    def __init__(self, bot, max_in_flight: int = 20, global_rate: float = 30.0,
+                 per_chat_rate: float = 1.0, max_retries: int = 3):
+        self.bot = bot
+        self.max_in_flight = max_in_flight
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        
+        self.global_bucket = TokenBucket(global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+    
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+    
+    async def broadcast(self, messages: Iterable[Tuple], before_send: Optional[Callable[[Tuple], Awaitable]] = None,
+                        on_result: Optional[Callable[[Tuple, Optional[Exception]], Awaitable]] = None) -> Dict:
+        """Рассылка (chat_id, текст, ...); messages может быть генератором
+        
+        Дополнительные элементы кортежа не используются движком и передаются
+        в хуки как есть: before_send(item) вызывается непосредственно перед
+        запросом к Telegram, on_result(item, error) - после окончательного
+        результата (error is None при успехе).
+        """
+        report = {'sent': 0, 'failed': 0, 'retried': 0}
+        started = time.monotonic()
+        pending = iter(messages)
+        
+        async def worker():
+            # Общий итератор: каждый воркер берет следующее сообщение, когда освободится
+            for item in pending:
+                await self._send_one(item, report, before_send, on_result)
+        
+        await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+        
+        duration = time.monotonic() - started
+        report['duration'] = duration
+        report['throughput'] = report['sent'] / duration if duration > 0 else 0.0
+        
+        self._prune_chat_buckets()
+        self._update_stats(report)
+        
+        return report
+    
+    async def _send_one(self, item: Tuple, report: Dict, before_send=None, on_result=None) -> bool:
+        """Отправка одного сообщения с повтором после RetryAfter"""
+        chat_id, text = item[0], item[1]
+        chat_bucket = self._chat_bucket(chat_id)
+        error = None
+        
+        for attempt in range(self.max_retries + 1):
+            # Сначала ведро чата: чат на паузе не должен занимать глобальный токен
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            
+            try:
+                if before_send:
+                    await before_send(item)
+                with SEND_SECONDS.time():
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+            except RetryAfter as e:
+                error = e
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                chat_bucket.pause(float(delay))
+                report['retried'] += 1
+                logger.warning(f"⏳ RetryAfter {delay}с для чата {chat_id} (попытка {attempt + 1})")
+                continue
+            except Exception as e:
+                error = e
+                logger.warning(f"Не удалось отправить уведомление пользователю {chat_id}: {e}")
+                break
+            
+            report['sent'] += 1
+            if on_result:
+                await on_result(item, None)
+            return True
+        
+        report['failed'] += 1
+        if on_result:
+            await on_result(item, error)
+        return False
+    
+    def _prune_chat_buckets(self):
+        """Удаление ведер чатов, которые больше ни на что не влияют"""
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle()]:
+            del self._chat_buckets[chat_id]
+    
+    def _update_stats(self, report: Dict):
+        """Учет результатов рассылки в метриках бота"""
+        NOTIFICATIONS_SENT.inc(report['sent'])
+        NOTIFICATIONS_FAILED.inc(report['failed'])
+        BROADCAST_THROUGHPUT.set(report['throughput'])
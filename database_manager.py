@@ -1,165 +1,144 @@
 import sqlite3
 import json
 import logging
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from itertools import islice
+from typing import List, Dict, Optional, Any, Iterable, Tuple, Callable
+
+from metrics import REGISTRY
+from schema_migrations import (CLAIM_NOTIFICATIONS_QUERY, CLAIM_POSTS_QUERY, CLEAN_API_CACHE_QUERY,
+                               LEAGUE_STANDINGS_QUERY, TODAY_MATCHES_QUERY, UNPUBLISHED_NEWS_QUERY,
+                               apply_migrations, get_schema_version)
 
 logger = logging.getLogger(__name__)
 
+# Время работы с соединением (включая ожидание писателя или свободного читателя)
+DB_WRITE_SECONDS = REGISTRY.histogram('bot_db_query_seconds', 'Время запросов к SQLite', mode='write')
+DB_READ_SECONDS = REGISTRY.histogram('bot_db_query_seconds', 'Время запросов к SQLite', mode='read')
+
 class DatabaseManager:
     """Расширенный менеджер базы данных для футбольного бота"""
     
-    def __init__(self, db_path: str = "football_data.db"):
-        self.db_path = db_path
-        self.init_database()
+    # PRAGMA для каждого соединения пула: WAL позволяет читателям не ждать писателя
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",
+    )
     
-    def init_database(self):
-        """Инициализация всех таблиц базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    # Размер порции для executemany в пакетных методах
+    BULK_CHUNK_SIZE = 500
+    
+    def __init__(self, db_path: str = "football_data.db", pool_size: int = 3):
+        self.db_path = db_path
+        self._closed = False
         
-        # Таблица для команд
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS teams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_id TEXT UNIQUE,
-                name TEXT NOT NULL,
-                league TEXT,
-                country TEXT,
-                logo_url TEXT,
-                founded INTEGER,
-                venue TEXT,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Один писатель: SQLite все равно допускает только одну пишущую транзакцию
+        self._writer = self._open_connection()
+        self._writer_lock = threading.RLock()
         
-        # Таблица для матчей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS matches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_id TEXT UNIQUE,
-                home_team TEXT NOT NULL,
-                away_team TEXT NOT NULL,
-                home_team_id TEXT,
-                away_team_id TEXT,
-                match_date TEXT,
-                match_time TEXT,
-                tournament TEXT,
-                tv_channel TEXT,
-                status TEXT DEFAULT 'scheduled',
-                home_score INTEGER DEFAULT 0,
-                away_score INTEGER DEFAULT 0,
-                venue TEXT,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Пул читателей. Для ':memory:' каждое соединение было бы отдельной БД,
+        # поэтому в этом случае чтение идет через писателя
+        self._readers = queue.Queue()
+        if db_path != ':memory:':
+            for _ in range(pool_size):
+                self._readers.put(self._open_connection())
         
-        # Таблица для новостей с улучшенной структурой
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS news (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                content TEXT,
-                summary TEXT,
-                news_type TEXT,
-                source TEXT,
-                tags TEXT,
-                importance INTEGER DEFAULT 1,
-                published_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_published BOOLEAN DEFAULT FALSE,
-                publish_count INTEGER DEFAULT 0,
-                UNIQUE(title, news_type)
-            )
-        ''')
+        # Подписчики на изменение турнирной таблицы (например, кэш изображений)
+        self._standings_listeners: List[Callable[[str], None]] = []
         
-        # Таблица для турнирной таблицы
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS league_table (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                team_name TEXT NOT NULL,
-                team_id TEXT,
-                position INTEGER,
-                games_played INTEGER,
-                wins INTEGER,
-                draws INTEGER,
-                losses INTEGER,
-                goals_for INTEGER,
-                goals_against INTEGER,
-                goal_difference INTEGER,
-                points INTEGER,
-                league TEXT,
-                season TEXT,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(team_name, league, season)
-            )
-        ''')
+        self.init_database()
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """Открытие соединения с настроенными PRAGMA"""
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def write_connection(self):
+        """Соединение-писатель: коммит при выходе, откат при ошибке"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("DatabaseManager уже закрыт")
         
-        # Таблица для игроков
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS players (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_id TEXT UNIQUE,
-                name TEXT NOT NULL,
-                team TEXT,
-                position TEXT,
-                age INTEGER,
-                nationality TEXT,
-                goals INTEGER DEFAULT 0,
-                assists INTEGER DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        with DB_WRITE_SECONDS.time(), self._writer_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    @contextmanager
+    def read_connection(self):
+        """Соединение-читатель из пула"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("DatabaseManager уже закрыт")
+        
+        with DB_READ_SECONDS.time():
+            if self.db_path == ':memory:':
+                with self._writer_lock:
+                    yield self._writer
+                return
+            
+            conn = self._readers.get()
+            try:
+                yield conn
+            finally:
+                # Завершаем транзакцию чтения, чтобы не удерживать снимок WAL
+                if conn.in_transaction:
+                    conn.rollback()
+                self._readers.put(conn)
+    
+    def close(self):
+        """Закрытие всех соединений пула"""
+        if self._closed:
+            return
+        self._closed = True
         
-        # Таблица для кэширования API запросов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS api_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                endpoint TEXT NOT NULL,
-                params TEXT,
-                response_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                UNIQUE(endpoint, params)
-            )
-        ''')
+        with self._writer_lock:
+            self._writer.close()
         
-        # Таблица для статистики бота
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                stat_type TEXT NOT NULL,
-                stat_value TEXT,
-                date TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
         
-        conn.commit()
-        conn.close()
-        logger.info("✅ База данных полностью инициализирована")
+        logger.info("🔒 Соединения с базой данных закрыты")
+    
+    def init_database(self):
+        """Инициализация всех таблиц базы данных через миграции схемы"""
+        with self.write_connection() as conn:
+            applied = apply_migrations(conn)
+            version = get_schema_version(conn)
+        
+        logger.info(f"✅ База данных полностью инициализирована (схема v{version}, новых миграций: {applied})")
     
     def save_team(self, team_data: Dict) -> bool:
         """Сохранение информации о команде"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO teams 
-                (api_id, name, league, country, logo_url, founded, venue)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                team_data.get('api_id'),
-                team_data.get('name'),
-                team_data.get('league'),
-                team_data.get('country'),
-                team_data.get('logo_url'),
-                team_data.get('founded'),
-                team_data.get('venue')
-            ))
+            with self.write_connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO teams 
+                    (api_id, name, league, country, logo_url, founded, venue)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    team_data.get('api_id'),
+                    team_data.get('name'),
+                    team_data.get('league'),
+                    team_data.get('country'),
+                    team_data.get('logo_url'),
+                    team_data.get('founded'),
+                    team_data.get('venue')
+                ))
             
-            conn.commit()
-            conn.close()
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения команды: {e}")
@@ -168,101 +147,301 @@ class DatabaseManager:
     def save_match(self, match_data: Dict) -> bool:
         """Сохранение информации о матче"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.write_connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO matches 
+                    (api_id, home_team, away_team, home_team_id, away_team_id,
+                     match_date, match_time, tournament, tv_channel, status,
+                     home_score, away_score, venue)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    match_data.get('api_id'),
+                    match_data.get('home_team'),
+                    match_data.get('away_team'),
+                    match_data.get('home_team_id'),
+                    match_data.get('away_team_id'),
+                    match_data.get('match_date'),
+                    match_data.get('match_time'),
+                    match_data.get('tournament'),
+                    match_data.get('tv_channel'),
+                    match_data.get('status', 'scheduled'),
+                    match_data.get('home_score', 0),
+                    match_data.get('away_score', 0),
+                    match_data.get('venue')
+                ))
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO matches 
-                (api_id, home_team, away_team, home_team_id, away_team_id,
-                 match_date, match_time, tournament, tv_channel, status,
-                 home_score, away_score, venue)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                match_data.get('api_id'),
-                match_data.get('home_team'),
-                match_data.get('away_team'),
-                match_data.get('home_team_id'),
-                match_data.get('away_team_id'),
-                match_data.get('match_date'),
-                match_data.get('match_time'),
-                match_data.get('tournament'),
-                match_data.get('tv_channel'),
-                match_data.get('status', 'scheduled'),
-                match_data.get('home_score', 0),
-                match_data.get('away_score', 0),
-                match_data.get('venue')
-            ))
-            
-            conn.commit()
-            conn.close()
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения матча: {e}")
             return False
     
+    # Пакетное сохранение: одна транзакция, executemany порциями по BULK_CHUNK_SIZE
+    
+    def save_matches_bulk(self, matches: Iterable[Dict]) -> Dict[str, int]:
+        """Пакетное сохранение матчей (ключ - api_id)"""
+        rows = ((
+            match_data.get('api_id'),
+            match_data.get('home_team'),
+            match_data.get('away_team'),
+            match_data.get('home_team_id'),
+            match_data.get('away_team_id'),
+            match_data.get('match_date'),
+            match_data.get('match_time'),
+            match_data.get('tournament'),
+            match_data.get('tv_channel'),
+            match_data.get('status', 'scheduled'),
+            match_data.get('home_score', 0),
+            match_data.get('away_score', 0),
+            match_data.get('venue')
+        ) for match_data in matches)
+        
+        return self._bulk_upsert(
+            'matches',
+            ('api_id', 'home_team', 'away_team', 'home_team_id', 'away_team_id',
+             'match_date', 'match_time', 'tournament', 'tv_channel', 'status',
+             'home_score', 'away_score', 'venue'),
+            ('api_id',),
+            rows
+        )
+    
+    def save_teams_bulk(self, teams: Iterable[Dict]) -> Dict[str, int]:
+        """Пакетное сохранение команд (ключ - api_id)"""
+        rows = ((
+            team_data.get('api_id'),
+            team_data.get('name'),
+            team_data.get('league'),
+            team_data.get('country'),
+            team_data.get('logo_url'),
+            team_data.get('founded'),
+            team_data.get('venue')
+        ) for team_data in teams)
+        
+        return self._bulk_upsert(
+            'teams',
+            ('api_id', 'name', 'league', 'country', 'logo_url', 'founded', 'venue'),
+            ('api_id',),
+            rows
+        )
+    
+    def save_players_bulk(self, players: Iterable[Dict]) -> Dict[str, int]:
+        """Пакетное сохранение игроков (ключ - api_id)"""
+        rows = ((
+            player_data.get('api_id'),
+            player_data.get('name'),
+            player_data.get('team'),
+            player_data.get('position'),
+            player_data.get('age'),
+            player_data.get('nationality'),
+            player_data.get('goals', 0),
+            player_data.get('assists', 0)
+        ) for player_data in players)
+        
+        return self._bulk_upsert(
+            'players',
+            ('api_id', 'name', 'team', 'position', 'age', 'nationality', 'goals', 'assists'),
+            ('api_id',),
+            rows
+        )
+    
+    def save_standings_bulk(self, standings: Iterable[Dict], league: str = 'Saudi Pro League',
+                            season: str = None) -> Dict[str, int]:
+        """Пакетное сохранение турнирной таблицы (ключ - команда, лига, сезон)
+        
+        Принимает строки в формате get_league_standings (name, games, ...).
+        """
+        season = season or self._current_season()
+        
+        rows = ((
+            row.get('name'),
+            row.get('team_id'),
+            row.get('position'),
+            row.get('games'),
+            row.get('wins'),
+            row.get('draws'),
+            row.get('losses'),
+            row.get('goals_for'),
+            row.get('goals_against'),
+            row.get('goal_difference', (row.get('goals_for') or 0) - (row.get('goals_against') or 0)),
+            row.get('points'),
+            row.get('league', league),
+            row.get('season', season)
+        ) for row in standings)
+        
+        result = self._bulk_upsert(
+            'league_table',
+            ('team_name', 'team_id', 'position', 'games_played', 'wins', 'draws', 'losses',
+             'goals_for', 'goals_against', 'goal_difference', 'points', 'league', 'season'),
+            ('team_name', 'league', 'season'),
+            rows
+        )
+        
+        if result['inserted'] or result['updated']:
+            self._notify_standings_changed(league)
+        
+        return result
+    
+    def add_standings_listener(self, callback: Callable[[str], None]):
+        """Подписка на изменение турнирной таблицы, callback(league) вызывается после коммита"""
+        self._standings_listeners.append(callback)
+    
+    def _notify_standings_changed(self, league: str):
+        """Оповещение подписчиков об изменении таблицы"""
+        for callback in self._standings_listeners:
+            try:
+                callback(league)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика изменения таблицы: {e}")
+    
+    @staticmethod
+    def _current_season() -> str:
+        """Текущий сезон в формате '2025/2026' (сезон начинается в августе)"""
+        now = datetime.now()
+        start = now.year if now.month >= 8 else now.year - 1
+        return f"{start}/{start + 1}"
+    
+    def _bulk_upsert(self, table: str, columns: Tuple[str, ...], key_columns: Tuple[str, ...],
+                     rows: Iterable[Tuple]) -> Dict[str, int]:
+        """Upsert строк одной транзакцией с подсчетом вставленных, обновленных и неизмененных записей
+        
+        Существующая строка перезаписывается, только если изменилось хотя бы
+        одно значение: повторное сохранение тех же данных не трогает
+        last_updated и не считается обновлением.
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        
+        value_columns = [column for column in columns if column not in key_columns]
+        updates = ', '.join(f"{column} = excluded.{column}" for column in value_columns)
+        changed = ' OR '.join(f"{column} IS NOT excluded.{column}" for column in value_columns)
+        query = f'''
+            INSERT INTO {table} ({', '.join(columns)})
+            VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET
+            {updates}, last_updated = CURRENT_TIMESTAMP
+            WHERE {changed}
+        '''
+        key_indexes = [columns.index(column) for column in key_columns]
+        
+        try:
+            with self.write_connection() as conn:
+                rows = iter(rows)
+                while True:
+                    chunk = list(islice(rows, self.BULK_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    
+                    keys = [tuple(row[i] for i in key_indexes) for row in chunk]
+                    existing = self._existing_keys(conn, table, key_columns, keys)
+                    
+                    inserted = 0
+                    for key in keys:
+                        # NULL в ключе никогда не конфликтует с UNIQUE - всегда вставка
+                        if None in key or key not in existing:
+                            inserted += 1
+                            existing.add(key)
+                    
+                    # rowcount - вставленные строки и те обновления, где сработал WHERE
+                    written = conn.executemany(query, chunk).rowcount
+                    counts['inserted'] += inserted
+                    counts['updated'] += written - inserted
+                    counts['unchanged'] += len(chunk) - written
+            
+            logger.info(f"✅ {table}: вставлено {counts['inserted']}, обновлено {counts['updated']}, "
+                        f"без изменений {counts['unchanged']}")
+            return counts
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного сохранения {table}: {e}")
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    
+    @staticmethod
+    def _existing_keys(conn: sqlite3.Connection, table: str, key_columns: Tuple[str, ...],
+                       keys: List[Tuple]) -> set:
+        """Ключи из порции, которые уже есть в таблице"""
+        keys = [key for key in keys if None not in key]
+        if not keys:
+            return set()
+        
+        row_placeholder = '(' + ', '.join('?' for _ in key_columns) + ')'
+        query = f'''
+            SELECT {', '.join(key_columns)} FROM {table}
+            WHERE ({', '.join(key_columns)}) IN (VALUES {', '.join(row_placeholder for _ in keys)})
+        '''
+        params = [value for key in keys for value in key]
+        
+        return {tuple(row) for row in conn.execute(query, params)}
+    
     def save_news_advanced(self, news_data: Dict) -> bool:
         """Расширенное сохранение новости"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Проверяем, существует ли уже такая новость
-            cursor.execute(
-                "SELECT id, publish_count FROM news WHERE title = ? AND news_type = ?",
-                (news_data.get('title'), news_data.get('news_type'))
-            )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Если новость уже существует, увеличиваем счетчик попыток публикации
+            with self.write_connection() as conn:
+                cursor = conn.cursor()
+                
+                # Проверяем, существует ли уже такая новость
                 cursor.execute(
-                    "UPDATE news SET publish_count = publish_count + 1 WHERE id = ?",
-                    (existing[0],)
+                    "SELECT id, publish_count FROM news WHERE title = ? AND news_type = ?",
+                    (news_data.get('title'), news_data.get('news_type'))
                 )
-                conn.commit()
-                conn.close()
-                return False  # Не публикуем повторно
-            
-            # Сохраняем новую новость
-            cursor.execute('''
-                INSERT INTO news 
-                (title, content, summary, news_type, source, tags, importance)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                news_data.get('title'),
-                news_data.get('content'),
-                news_data.get('summary'),
-                news_data.get('news_type'),
-                news_data.get('source', 'generated'),
-                json.dumps(news_data.get('tags', [])),
-                news_data.get('importance', 1)
-            ))
+                existing = cursor.fetchone()
+                
+                if existing:
+                    # Если новость уже существует, увеличиваем счетчик попыток публикации
+                    cursor.execute(
+                        "UPDATE news SET publish_count = publish_count + 1 WHERE id = ?",
+                        (existing[0],)
+                    )
+                    return False  # Не публикуем повторно
+                
+                # Сохраняем новую новость
+                cursor.execute('''
+                    INSERT INTO news 
+                    (title, content, summary, news_type, source, tags, importance)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    news_data.get('title'),
+                    news_data.get('content'),
+                    news_data.get('summary'),
+                    news_data.get('news_type'),
+                    news_data.get('source', 'generated'),
+                    json.dumps(news_data.get('tags', [])),
+                    news_data.get('importance', 1)
+                ))
             
-            conn.commit()
-            conn.close()
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения новости: {e}")
             return False
     
+    def save_post(self, content: str, post_type: str) -> bool:
+        """Сохранение уже опубликованного поста в историю новостей"""
+        try:
+            title = content.strip().split('\n', 1)[0][:200]
+            
+            with self.write_connection() as conn:
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO news
+                    (title, content, news_type, source, is_published, publish_count)
+                    VALUES (?, ?, ?, 'bot', TRUE, 1)
+                ''', (title, content, post_type))
+            
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения поста: {e}")
+            return False
+    
     def get_unpublished_news(self, news_type: str = None, limit: int = 5) -> List[Dict]:
         """Получение неопубликованных новостей"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = "SELECT * FROM news WHERE is_published = FALSE"
             params = []
+            news_filter = ""
             
             if news_type:
-                query += " AND news_type = ?"
+                news_filter = " AND news_type = ?"
                 params.append(news_type)
             
-            query += " ORDER BY importance DESC, published_date DESC LIMIT ?"
+            query = UNPUBLISHED_NEWS_QUERY.format(filter=news_filter)
             params.append(limit)
             
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+            with self.read_connection() as conn:
+                rows = conn.execute(query, params).fetchall()
             
             news_list = []
             for row in rows:
@@ -278,7 +457,6 @@ class DatabaseManager:
                     'published_date': row[8]
                 })
             
-            conn.close()
             return news_list
         except Exception as e:
             logger.error(f"❌ Ошибка получения новостей: {e}")
@@ -287,51 +465,71 @@ class DatabaseManager:
     def mark_news_published(self, news_id: int):
         """Отметить новость как опубликованную"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "UPDATE news SET is_published = TRUE WHERE id = ?",
-                (news_id,)
-            )
-            
-            conn.commit()
-            conn.close()
+            with self.write_connection() as conn:
+                conn.execute(
+                    "UPDATE news SET is_published = TRUE WHERE id = ?",
+                    (news_id,)
+                )
         except Exception as e:
             logger.error(f"❌ Ошибка обновления статуса новости: {e}")
     
-    def save_api_cache(self, endpoint: str, params: str, response_data: Any, ttl_minutes: int = 60):
-        """Сохранение кэша API запроса"""
+    @staticmethod
+    def _api_cache_deadlines(ttl_minutes: int, hard_ttl_minutes: Optional[int]) -> Tuple[datetime, datetime]:
+        """Сроки кэша API: до какого момента ответ свежий и до какого его можно отдавать"""
+        now = datetime.now()
+        return (now + timedelta(minutes=ttl_minutes),
+                now + timedelta(minutes=max(ttl_minutes, hard_ttl_minutes or ttl_minutes)))
+    
+    def save_api_cache(self, endpoint: str, params: str, response_data: Any, ttl_minutes: int = 60,
+                       hard_ttl_minutes: Optional[int] = None, etag: Optional[str] = None,
+                       last_modified: Optional[str] = None) -> Optional[int]:
+        """Сохранение кэша API запроса
+        
+        ttl_minutes - сколько ответ считается свежим, hard_ttl_minutes - сколько
+        его еще можно отдавать устаревшим (по умолчанию столько же). etag и
+        last_modified - валидаторы ответа для условного запроса при обновлении.
+        Возвращает id записи - версию ответа: он меняется при каждой записи
+        нового ответа и сохраняется при продлении (touch_api_cache).
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            expires_at = datetime.now() + timedelta(minutes=ttl_minutes)
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO api_cache 
-                (endpoint, params, response_data, expires_at)
-                VALUES (?, ?, ?, ?)
-            ''', (endpoint, params, json.dumps(response_data), expires_at))
-            
-            conn.commit()
-            conn.close()
+            fresh_until, expires_at = self._api_cache_deadlines(ttl_minutes, hard_ttl_minutes)
+            
+            with self.write_connection() as conn:
+                cursor = conn.execute('''
+                    INSERT OR REPLACE INTO api_cache 
+                    (endpoint, params, response_data, fresh_until, expires_at, etag, last_modified)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (endpoint, params, json.dumps(response_data), fresh_until, expires_at,
+                      etag, last_modified))
+            return cursor.lastrowid
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения кэша: {e}")
+            return None
+    
+    def touch_api_cache(self, endpoint: str, params: str, ttl_minutes: int = 60,
+                        hard_ttl_minutes: Optional[int] = None) -> bool:
+        """Продление кэша API без перезаписи ответа (сервер ответил 304 Not Modified)"""
+        try:
+            fresh_until, expires_at = self._api_cache_deadlines(ttl_minutes, hard_ttl_minutes)
+            
+            with self.write_connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE api_cache SET fresh_until = ?, expires_at = ?
+                    WHERE endpoint = ? AND params = ?
+                ''', (fresh_until, expires_at, endpoint, params))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка продления кэша: {e}")
+            return False
     
     def get_api_cache(self, endpoint: str, params: str) -> Optional[Any]:
-        """Получение кэшированного ответа API"""
+        """Получение кэшированного ответа API, только если он еще свежий"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT response_data FROM api_cache 
-                WHERE endpoint = ? AND params = ? AND expires_at > ?
-            ''', (endpoint, params, datetime.now()))
-            
-            row = cursor.fetchone()
-            conn.close()
+            with self.read_connection() as conn:
+                row = conn.execute('''
+                    SELECT response_data FROM api_cache 
+                    WHERE endpoint = ? AND params = ? AND COALESCE(fresh_until, expires_at) > ?
+                ''', (endpoint, params, datetime.now())).fetchone()
             
             if row:
                 return json.loads(row[0])
@@ -340,17 +538,37 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка получения кэша: {e}")
             return None
     
+    def get_api_cache_entry(self, endpoint: str, params: str) -> Optional[Dict]:
+        """Кэшированный ответ API со сроками жизни и валидаторами, пока не истек жесткий срок"""
+        try:
+            with self.read_connection() as conn:
+                row = conn.execute('''
+                    SELECT response_data, COALESCE(fresh_until, expires_at), expires_at, etag, last_modified, id
+                    FROM api_cache 
+                    WHERE endpoint = ? AND params = ? AND expires_at > ?
+                ''', (endpoint, params, datetime.now())).fetchone()
+            
+            if not row:
+                return None
+            return {
+                'data': json.loads(row[0]),
+                'fresh_until': datetime.fromisoformat(row[1]),
+                'expires_at': datetime.fromisoformat(row[2]),
+                'size': len(row[0]),
+                'etag': row[3],
+                'last_modified': row[4],
+                'version': row[5]
+            }
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения кэша: {e}")
+            return None
+    
     def clean_old_cache(self):
         """Очистка устаревшего кэша"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM api_cache WHERE expires_at < ?", (datetime.now(),))
-            deleted = cursor.rowcount
-            
-            conn.commit()
-            conn.close()
+            with self.write_connection() as conn:
+                cursor = conn.execute(CLEAN_API_CACHE_QUERY, (datetime.now(),))
+                deleted = cursor.rowcount
             
             if deleted > 0:
                 logger.info(f"🧹 Очищено {deleted} устаревших записей кэша")
@@ -360,36 +578,21 @@ class DatabaseManager:
     def save_bot_stat(self, stat_type: str, stat_value: str):
         """Сохранение статистики бота"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO bot_stats (stat_type, stat_value, date)
-                VALUES (?, ?, ?)
-            ''', (stat_type, stat_value, datetime.now().strftime('%Y-%m-%d')))
-            
-            conn.commit()
-            conn.close()
+            with self.write_connection() as conn:
+                conn.execute('''
+                    INSERT INTO bot_stats (stat_type, stat_value, date)
+                    VALUES (?, ?, ?)
+                ''', (stat_type, stat_value, datetime.now().strftime('%Y-%m-%d')))
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения статистики: {e}")
     
     def get_today_matches(self) -> List[Dict]:
         """Получение матчей на сегодня из БД"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             today = datetime.now().strftime('%Y-%m-%d')
             
-            cursor.execute('''
-                SELECT home_team, away_team, match_time, tournament, tv_channel, status
-                FROM matches 
-                WHERE match_date = ?
-                ORDER BY match_time
-            ''', (today,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with self.read_connection() as conn:
+                rows = conn.execute(TODAY_MATCHES_QUERY, (today,)).fetchall()
             
             matches = []
             for row in rows:
@@ -407,22 +610,41 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка получения матчей: {e}")
             return []
     
-    def get_league_standings(self, league: str = 'Saudi Pro League') -> List[Dict]:
-        """Получение турнирной таблицы из БД"""
+    def get_match_kickoffs(self, start: datetime, end: datetime) -> List[datetime]:
+        """Время начала матчей в интервале [start, end], кроме отмененных и перенесенных"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT team_name, position, games_played, wins, draws, losses,
-                       goals_for, goals_against, goal_difference, points
-                FROM league_table 
-                WHERE league = ?
-                ORDER BY position ASC
-            ''', (league,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with self.read_connection() as conn:
+                rows = conn.execute('''
+                    SELECT match_date, match_time
+                    FROM matches
+                    WHERE match_date BETWEEN ? AND ?
+                      AND status NOT IN ('postponed', 'cancelled')
+                    ORDER BY match_date, match_time
+                ''', (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))).fetchall()
+            
+            kickoffs = []
+            for match_date, match_time in rows:
+                try:
+                    kickoff = datetime.strptime(f"{match_date} {match_time}", '%Y-%m-%d %H:%M')
+                except (TypeError, ValueError):
+                    continue
+                if start <= kickoff <= end:
+                    kickoffs.append(kickoff)
+            
+            return kickoffs
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения расписания матчей: {e}")
+            return []
+    
+    def get_league_standings(self, league: str = 'Saudi Pro League', season: str = None) -> List[Dict]:
+        """Получение турнирной таблицы из БД
+        
+        В таблице хранятся строки всех загруженных сезонов, поэтому читается
+        один сезон: season или последний по названию ('2025/2026').
+        """
+        try:
+            with self.read_connection() as conn:
+                rows = conn.execute(LEAGUE_STANDINGS_QUERY, (league, season, league)).fetchall()
             
             standings = []
             for row in rows:
@@ -444,30 +666,232 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка получения таблицы: {e}")
             return []
     
+    # Outbox: постоянная очередь исходящих сообщений
+    
+    def enqueue_outbox(self, messages: Iterable[Dict]) -> int:
+        """Постановка сообщений в outbox одной транзакцией
+        
+        Сообщения с уже известным idempotency_key пропускаются, поэтому
+        повторная постановка после перезапуска не создает дублей.
+        """
+        try:
+            now = datetime.now()
+            rows = ((
+                message['idempotency_key'],
+                message['chat_id'],
+                message.get('message_type', 'post'),
+                json.dumps({'text': message['text']}),
+                now
+            ) for message in messages)
+            
+            with self.write_connection() as conn:
+                cursor = conn.executemany('''
+                    INSERT OR IGNORE INTO outbox
+                    (idempotency_key, chat_id, message_type, payload, next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+            
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка постановки в outbox: {e}")
+            return 0
+    
+    def claim_outbox_batch(self, limit: int = 100) -> List[Dict]:
+        """Захват порции сообщений, готовых к отправке (pending -> claimed)
+        
+        Посты канала захватываются первыми, поэтому новый пост не ждет,
+        пока разойдется накопившаяся очередь уведомлений.
+        """
+        try:
+            now = datetime.now()
+            with self.write_connection() as conn:
+                rows = conn.execute(CLAIM_POSTS_QUERY, (now, limit)).fetchall()
+                
+                if len(rows) < limit:
+                    rows += conn.execute(CLAIM_NOTIFICATIONS_QUERY, (now, limit - len(rows))).fetchall()
+                
+                conn.executemany(
+                    "UPDATE outbox SET status = 'claimed' WHERE id = ?",
+                    [(row[0],) for row in rows]
+                )
+            
+            batch = []
+            for row in rows:
+                batch.append({
+                    'id': row[0],
+                    'idempotency_key': row[1],
+                    'chat_id': row[2],
+                    'message_type': row[3],
+                    'text': json.loads(row[4])['text'],
+                    'attempts': row[5]
+                })
+            
+            return batch
+        except Exception as e:
+            logger.error(f"❌ Ошибка захвата сообщений outbox: {e}")
+            return []
+    
+    def mark_outbox_sending(self, outbox_id: int):
+        """Отметка непосредственно перед запросом к Telegram"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute("UPDATE outbox SET status = 'sending' WHERE id = ?", (outbox_id,))
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления outbox: {e}")
+    
+    def mark_outbox_sent(self, outbox_id: int):
+        """Отметка об успешной доставке"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute(
+                    "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                    (datetime.now(), outbox_id)
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления outbox: {e}")
+    
+    def mark_outbox_failed(self, outbox_id: int, error: str, retry_at: Optional[datetime] = None):
+        """Неудачная попытка: повтор в retry_at или окончательная ошибка, если retry_at не задан"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute('''
+                    UPDATE outbox
+                    SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                    WHERE id = ?
+                ''', ('pending' if retry_at else 'failed', retry_at, error, outbox_id))
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления outbox: {e}")
+    
+    def recover_outbox(self) -> Dict[str, int]:
+        """Восстановление outbox после аварийной остановки или прерванной выгрузки
+        
+        Захваченные, но не начатые сообщения возвращаются в очередь.
+        Сообщения в статусе 'sending' могли уже дойти до Telegram, поэтому
+        они помечаются 'unknown' и не отправляются повторно.
+        """
+        try:
+            with self.write_connection() as conn:
+                requeued = conn.execute(
+                    "UPDATE outbox SET status = 'pending' WHERE status = 'claimed'"
+                ).rowcount
+                uncertain = conn.execute(
+                    "UPDATE outbox SET status = 'unknown' WHERE status = 'sending'"
+                ).rowcount
+            
+            if requeued or uncertain:
+                logger.info(f"♻️ Outbox восстановлен: в очередь {requeued}, без повтора {uncertain}")
+            return {'requeued': requeued, 'uncertain': uncertain}
+        except Exception as e:
+            logger.error(f"❌ Ошибка восстановления outbox: {e}")
+            return {'requeued': 0, 'uncertain': 0}
+    
+    def get_outbox_stats(self) -> Dict[str, int]:
+        """Количество сообщений outbox по статусам"""
+        try:
+            with self.read_connection() as conn:
+                rows = conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+            return {status: count for status, count in rows}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики outbox: {e}")
+            return {}
+    
+    # file_id изображений, уже загруженных в Telegram
+    
+    def get_image_file_id(self, image_hash: str) -> Optional[str]:
+        """file_id ранее загруженного изображения"""
+        try:
+            with self.read_connection() as conn:
+                row = conn.execute(
+                    "SELECT file_id FROM image_files WHERE image_hash = ?", (image_hash,)
+                ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения file_id: {e}")
+            return None
+    
+    def save_image_file_id(self, image_hash: str, file_id: str):
+        """Сохранение file_id, который Telegram вернул после загрузки"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_files (image_hash, file_id) VALUES (?, ?)",
+                    (image_hash, file_id)
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения file_id: {e}")
+    
+    def delete_image_file_id(self, image_hash: str):
+        """Удаление file_id, который Telegram больше не принимает"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute("DELETE FROM image_files WHERE image_hash = ?", (image_hash,))
+        except Exception as e:
+            logger.error(f"❌ Ошибка удаления file_id: {e}")
+    
+    # Последние запуски периодических задач
+    
+    def save_job_run(self, job_name: str, started_at: datetime, status: str):
+        """Запись запуска задачи; время успешного запуска обновляется только при status='ok'"""
+        try:
+            with self.write_connection() as conn:
+                conn.execute('''
+                    INSERT INTO job_runs (job_name, last_success_at, last_attempt_at, last_status)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(job_name) DO UPDATE SET
+                        last_success_at = COALESCE(excluded.last_success_at, job_runs.last_success_at),
+                        last_attempt_at = excluded.last_attempt_at,
+                        last_status = excluded.last_status
+                ''', (job_name, started_at if status == 'ok' else None, started_at, status))
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения запуска задачи: {e}")
+    
+    def get_job_last_runs(self) -> Dict[str, datetime]:
+        """Время последнего успешного запуска по задачам"""
+        try:
+            with self.read_connection() as conn:
+                rows = conn.execute(
+                    "SELECT job_name, last_success_at FROM job_runs WHERE last_success_at IS NOT NULL"
+                ).fetchall()
+            return {name: datetime.fromisoformat(value) for name, value in rows}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения запусков задач: {e}")
+            return {}
+    
+    def ping(self) -> bool:
+        """Проверка доступности БД для /healthz: чтение и запись"""
+        try:
+            with self.read_connection() as conn:
+                conn.execute("SELECT 1").fetchone()
+            with self.write_connection() as conn:
+                conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+            return True
+        except Exception as e:
+            logger.error(f"❌ БД недоступна: {e}")
+            return False
+    
     def get_database_stats(self) -> Dict:
         """Получение статистики базы данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             stats = {}
             
-            # Количество записей в каждой таблице
-            tables = ['teams', 'matches', 'news', 'league_table', 'players', 'api_cache']
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                
+                # Количество записей в каждой таблице
+                tables = ['teams', 'matches', 'news', 'league_table', 'players', 'api_cache']
+                
+                for table in tables:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    stats[f'{table}_count'] = cursor.fetchone()[0]
+                
+                # Количество опубликованных новостей
+                cursor.execute("SELECT COUNT(*) FROM news WHERE is_published = TRUE")
+                stats['published_news'] = cursor.fetchone()[0]
+                
+                # Количество неопубликованных новостей
+                cursor.execute("SELECT COUNT(*) FROM news WHERE is_published = FALSE")
+                stats['unpublished_news'] = cursor.fetchone()[0]
             
-            for table in tables:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                stats[f'{table}_count'] = cursor.fetchone()[0]
-            
-            # Количество опубликованных новостей
-            cursor.execute("SELECT COUNT(*) FROM news WHERE is_published = TRUE")
-            stats['published_news'] = cursor.fetchone()[0]
-            
-            # Количество неопубликованных новостей
-            cursor.execute("SELECT COUNT(*) FROM news WHERE is_published = FALSE")
-            stats['unpublished_news'] = cursor.fetchone()[0]
-            
-            conn.close()
             return stats
         except Exception as e:
             logger.error(f"❌ Ошибка получения статистики БД: {e}")
@@ -511,5 +935,5 @@ if __name__ == "__main__":
     stats = db.get_database_stats()
     print(f"📊 Статистика БД: {stats}")
     
+    db.close()
     print("🎉 Тестирование завершено!")
-
@@ -0,0 +1,141 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+# Таблица транслитерации кириллицы в латиницу для поиска латинских написаний
+TRANSLIT_TABLE = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Последние буквы, которые при склонении заменяются окончанием: Хиляль -> Хиляля,
+# Бензема -> Бензему. Основа без них должна быть не короче INFLECTION_MIN_STEM
+INFLECTED_ENDINGS = 'ьйая'
+INFLECTION_MIN_STEM = 4
+
+# Нормализация: регистр, ё/е, дефисы и апострофы не должны мешать совпадению
+_NORMALIZE = str.maketrans({'ё': 'е', '-': ' ', '‑': ' ', '–': ' ', '’': "'", '`': "'"})
+
+def normalize(text: str) -> str:
+    """Приведение текста к виду, в котором ищутся упоминания"""
+    return text.lower().translate(_NORMALIZE)
+
+def inflection_stem(key: str) -> str:
+    """Основа нормализованного написания, к которой присоединяются окончания"""
+    if key[-1:] in INFLECTED_ENDINGS and len(key) - 1 >= INFLECTION_MIN_STEM:
+        return key[:-1]
+    return key
+
+def transliterate(text: str) -> str:
+    """Транслитерация кириллического названия в латиницу"""
+    return ''.join(TRANSLIT_TABLE.get(ch, ch) for ch in text.lower())
+
+class EntityMatcher:
+    """Поиск упоминаний сущностей алгоритмом Ахо-Корасик
+    
+    Автомат строится один раз по всем названиям и псевдонимам, после чего
+    все упоминания находятся за один проход по тексту независимо от
+    количества сущностей. Совпадение засчитывается только с начала слова,
+    окончания допускаются ("Аль-Шабабом" находит "Аль-Шабаб"). Для
+    написаний, у которых последняя буква меняется при склонении, ищется
+    основа без нее ("Аль-Хиляля" находит "Аль-Хиляль").
+    """
+    
+    def __init__(self, patterns: Dict[str, Tuple[str, str]]):
+        # patterns: написание -> (каноническое название, тип сущности)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Tuple[str, str]]]] = [[]]
+        
+        for alias, entity in patterns.items():
+            key = normalize(alias)
+            self._add_pattern(key, entity)
+            stem = inflection_stem(key)
+            if stem != key:
+                self._add_pattern(stem, entity)
+        self._build_failure_links()
+        
+        self.pattern_count = len(patterns)
+    
+    def _add_pattern(self, key: str, entity: Tuple[str, str]):
+        """Добавление написания в бор"""
+        if not key:
+            return
+        
+        node = 0
+        for ch in key:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][ch] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = child
+        
+        self._out[node].append((len(key), entity))
+    
+    def _build_failure_links(self):
+        """Построение суффиксных ссылок обходом в ширину"""
+        queue = deque(self._goto[0].values())
+        
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child].extend(self._out[self._fail[child]])
+    
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """Все упомянутые сущности (название, тип) в порядке первого упоминания"""
+        text = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        
+        found: Dict[Tuple[str, str], int] = {}
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            
+            for length, entity in out[node]:
+                start = i - length + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if entity not in found:
+                    found[entity] = start
+        
+        return sorted(found, key=found.get)
+
+# Проверка поиска упоминаний
+if __name__ == "__main__":
+    print("🧪 Тестирование поиска упоминаний...")
+    
+    matcher = EntityMatcher({
+        'Аль-Хиляль': ('Аль-Хиляль', 'team'),
+        'Al-Hilal': ('Аль-Хиляль', 'team'),
+        'Аль-Шабаб': ('Аль-Шабаб', 'team'),
+        'Бензема': ('Карим Бензема', 'player'),
+        'Махрез': ('Рияд Махрез', 'player'),
+    })
+    
+    cases = [
+        ("Аль-Хиляль победил", [('Аль-Хиляль', 'team')]),
+        ("Матч Аль-Хиляля и Аль-Шабаба", [('Аль-Хиляль', 'team'), ('Аль-Шабаб', 'team')]),
+        ("Тренер доволен Аль-Хилялем", [('Аль-Хиляль', 'team')]),
+        ("Гол Бензему не засчитали, Махрезом довольны", [('Карим Бензема', 'player'), ('Рияд Махрез', 'player')]),
+        ("al hilal wins", [('Аль-Хиляль', 'team')]),
+        ("Хиляль без приставки не найден", []),
+    ]
+    for text, expected in cases:
+        found = matcher.find(text)
+        assert found == expected, (text, found)
+        print(f"✅ {text!r}: {found}")
+    
+    print("🎉 Тестирование завершено!")
@@ -1,12 +1,20 @@
 import logging
 import traceback
+import random
 import sys
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any
-from functools import wraps
+from typing import Optional, Dict, Any, Callable
+from functools import partial, wraps
 import asyncio
 import json
 
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from metrics import LATENCY_METRICS, REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
 class BotLogger:
     """Улучшенная система логирования для футбольного бота"""
     
@@ -137,20 +145,134 @@ class BotLogger:
             'log_file': self.log_file
         }
 
+class CircuitOpenError(Exception):
+    """Запрос не выполнялся: цепь эндпоинта разомкнута"""
+    
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: цепь разомкнута, повтор через {retry_in:.0f}с")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """Автоматический выключатель для одного эндпоинта внешнего API
+    
+    closed - запросы идут как обычно, подряд идущие ошибки считаются.
+    После failure_threshold ошибок цепь размыкается (open): запросы сразу
+    отклоняются, не дожидаясь таймаутов неработающего сервиса. Через
+    cooldown секунд цепь становится полуоткрытой (half_open) и пропускает
+    пробный запрос: успех замыкает цепь, ошибка снова размыкает ее.
+    Запрос, который ничего не говорит о доступности сервиса (отменен или
+    отклонен как неверный), должен вызвать release(), иначе его место
+    пробного запроса останется занятым.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 60.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._stats = {'failures': 0, 'rejected': 0, 'opened': 0}
+    
+    @property
+    def state(self) -> str:
+        """Текущее состояние; по истечении cooldown разомкнутая цепь становится полуоткрытой"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+            logger.info(f"🔌 Цепь {self.name}: пробный запрос")
+        return self._state
+    
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        self._stats['rejected'] += 1
+        return False
+    
+    def retry_in(self) -> float:
+        """Сколько секунд осталось до пробного запроса"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+    
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info(f"✅ Цепь {self.name} замкнута: сервис снова отвечает")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probes = 0
+    
+    def release(self):
+        """Освобождение места пробного запроса без изменения состояния"""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+    
+    def record_failure(self):
+        self._failures += 1
+        self._stats['failures'] += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+    
+    def _open(self):
+        if self._state != self.OPEN:
+            self._stats['opened'] += 1
+            logger.warning(f"🔌 Цепь {self.name} разомкнута после {self._failures} ошибок "
+                           f"на {self.cooldown:.0f}с")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+    
+    def get_state(self) -> Dict:
+        """Состояние для сводки ошибок"""
+        return dict(self._stats, state=self.state, consecutive_failures=self._failures,
+                    retry_in=round(self.retry_in(), 1))
+
 class ErrorHandler:
     """Класс для обработки ошибок бота"""
     
-    def __init__(self, logger: BotLogger, bot_app=None):
+    def __init__(self, logger: BotLogger, bot_app=None, circuit_failure_threshold: int = 5,
+                 circuit_cooldown: float = 60.0):
         self.logger = logger
         self.bot_app = bot_app
         self.critical_errors = []
         self.retry_attempts = {}
-        
+        self.retry_stats = {'retries': 0, 'exhausted': 0}
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+    
     def handle_telegram_error(self, error: Exception, context: str = "Telegram API"):
-        """Обработка ошибок Telegram API"""
+        """Обработка ошибок Telegram API
+        
+        Сначала по типу исключения PTB (их тексты не содержат ни "rate limit",
+        ни "timeout"), затем по тексту. BadRequest в PTB - подкласс
+        NetworkError, но это ошибка запроса, а не сети.
+        """
         error_type = type(error).__name__
         
-        if "rate limit" in str(error).lower():
+        if isinstance(error, RetryAfter):
+            self.logger.log_warning(f"Превышен лимит запросов Telegram API, пауза {error.retry_after}с", context)
+            return "rate_limit"
+        elif isinstance(error, TimedOut):
+            self.logger.log_warning(f"Таймаут запроса к Telegram API: {error}", context)
+            return "timeout"
+        elif isinstance(error, NetworkError) and not isinstance(error, BadRequest):
+            self.logger.log_warning(f"Проблема с подключением к Telegram API: {error}", context)
+            return "connection"
+        elif "rate limit" in str(error).lower():
             self.logger.log_warning("Превышен лимит запросов Telegram API", context)
             return "rate_limit"
         elif "forbidden" in str(error).lower():
@@ -224,6 +346,15 @@ class ErrorHandler:
         if operation_key in self.retry_attempts:
             del self.retry_attempts[operation_key]
     
+    def circuit(self, endpoint: str) -> CircuitBreaker:
+        """Выключатель эндпоинта, создается при первом обращении"""
+        breaker = self.circuit_breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.circuit_breakers[endpoint] = CircuitBreaker(
+                endpoint, self.circuit_failure_threshold, self.circuit_cooldown
+            )
+        return breaker
+    
     def add_critical_error(self, error: Exception, context: str):
         """Добавление критической ошибки"""
         critical_error = {
@@ -247,55 +378,119 @@ class ErrorHandler:
             'critical_errors_count': len(self.critical_errors),
             'recent_critical_errors': self.critical_errors[-3:] if self.critical_errors else [],
             'active_retries': len(self.retry_attempts),
-            'retry_operations': list(self.retry_attempts.keys())
+            'retry_operations': list(self.retry_attempts.keys()),
+            'retries': self.retry_stats['retries'],
+            'retries_exhausted': self.retry_stats['exhausted'],
+            'circuit_breakers': {name: breaker.get_state() for name, breaker in self.circuit_breakers.items()},
+            'open_circuits': [name for name, breaker in self.circuit_breakers.items()
+                              if breaker.state != CircuitBreaker.CLOSED]
         }
 
-def error_handler_decorator(error_handler: ErrorHandler, operation_name: str):
-    """Декоратор для автоматической обработки ошибок"""
+# Типы ошибок (см. handle_telegram_error / handle_database_error), после которых имеет смысл повтор
+RETRYABLE_ERRORS = ("timeout", "connection", "rate_limit", "locked")
+
+class RetryPolicy:
+    """Параметры повторов: экспоненциальная пауза с полным джиттером и общий бюджет времени
+    
+    Пауза перед повтором n выбирается случайно из [0, min(max_delay, base_delay * 2^(n-1))],
+    поэтому одновременно упавшие вызовы повторяются вразброс, а не все разом.
+    deadline ограничивает общее время вызова со всеми повторами (None - без ограничения).
+    """
+    
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 deadline: Optional[float] = 120.0, retryable: tuple = RETRYABLE_ERRORS):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable = retryable
+    
+    def backoff(self, attempt: int) -> float:
+        """Пауза после неудачной попытки attempt (нумерация с 1)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+async def call_with_retry(error_handler: ErrorHandler, operation_name: str, func: Callable, *args,
+                          policy: Optional[RetryPolicy] = None, **kwargs) -> Any:
+    """Вызов func с повторами по policy
+    
+    Счетчик попыток у каждого вызова свой, поэтому одновременные вызовы одной
+    операции не расходуют попытки друг друга. Синхронная функция выполняется
+    в пуле потоков цикла событий, а паузы между попытками асинхронные, так
+    что цикл не блокируется ни вызовом, ни ожиданием. Ошибки корутин
+    классифицируются как ошибки Telegram, синхронных функций - как ошибки БД.
+    Если ошибка сообщает retry_after (RetryAfter от Telegram), пауза не
+    короче него.
+    
+    policy.deadline прерывает только попытки-корутины. Синхронную попытку
+    в потоке прервать нельзя: если бы ожидание прерывалось по deadline, она
+    продолжала бы выполняться одновременно со следующей. Поэтому ее всегда
+    дожидаются, а deadline для нее ограничивает только новые повторы.
+    """
+    policy = policy or RetryPolicy()
+    is_async = asyncio.iscoroutinefunction(func)
+    classify = error_handler.handle_telegram_error if is_async else error_handler.handle_database_error
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    attempt = 0
+    
+    while True:
+        attempt += 1
+        try:
+            if not is_async:
+                return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+            call = func(*args, **kwargs)
+            if policy.deadline is None:
+                return await call
+            remaining = policy.deadline - (time.monotonic() - started)
+            return await asyncio.wait_for(call, remaining)
+        except Exception as e:
+            error_type = classify(e, operation_name)
+            
+            delay = policy.backoff(attempt)
+            retry_after = getattr(e, 'retry_after', None)
+            if retry_after is not None:
+                delay = max(delay, retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after)
+            
+            elapsed = time.monotonic() - started
+            out_of_budget = policy.deadline is not None and elapsed + delay >= policy.deadline
+            if error_type not in policy.retryable or attempt >= policy.max_attempts or out_of_budget:
+                if error_type in policy.retryable:
+                    error_handler.retry_stats['exhausted'] += 1
+                    error_handler.logger.log_warning(
+                        f"Повторы {operation_name} исчерпаны: {attempt} попыток за {elapsed:.1f}с"
+                    )
+                error_handler.add_critical_error(e, operation_name)
+                raise
+            
+            error_handler.retry_stats['retries'] += 1
+            error_handler.logger.log_info(f"Повтор #{attempt} для {operation_name} через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+def error_handler_decorator(error_handler: ErrorHandler, operation_name: str,
+                            policy: Optional[RetryPolicy] = None):
+    """Декоратор для автоматической обработки ошибок с повторами через call_with_retry
+    
+    Обернутая функция всегда становится корутиной, даже если исходная
+    синхронная: сам вызов и паузы между повторами не блокируют цикл событий.
+    """
     def decorator(func):
         @wraps(func)
-        async def async_wrapper(*args, **kwargs):
-            try:
-                result = await func(*args, **kwargs)
-                error_handler.reset_retry_counter(operation_name)
-                return result
-            except Exception as e:
-                error_type = error_handler.handle_telegram_error(e, operation_name)
-                
-                if error_handler.should_retry(error_type, operation_name):
-                    # Ждем перед повтором
-                    await asyncio.sleep(2 ** error_handler.retry_attempts.get(operation_name, 1))
-                    return await async_wrapper(*args, **kwargs)
-                else:
-                    error_handler.add_critical_error(e, operation_name)
-                    raise
-        
-        @wraps(func)
-        def sync_wrapper(*args, **kwargs):
-            try:
-                result = func(*args, **kwargs)
-                error_handler.reset_retry_counter(operation_name)
-                return result
-            except Exception as e:
-                error_type = error_handler.handle_database_error(e, operation_name)
-                
-                if error_handler.should_retry(error_type, operation_name):
-                    return sync_wrapper(*args, **kwargs)
-                else:
-                    error_handler.add_critical_error(e, operation_name)
-                    raise
-        
-        return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+        async def wrapper(*args, **kwargs):
+            return await call_with_retry(error_handler, operation_name, func, *args, policy=policy, **kwargs)
+        return wrapper
     return decorator
 
 class HealthChecker:
     """Класс для мониторинга здоровья бота"""
     
-    def __init__(self, logger: BotLogger):
+    def __init__(self, logger: BotLogger, metrics: Optional[MetricsRegistry] = None, loop_monitor=None):
         self.logger = logger
+        self.metrics = metrics or REGISTRY
+        self.loop_monitor = loop_monitor
         self.last_successful_message = None
         self.last_api_call = None
         self.last_db_operation = None
+        self.last_db_failure = None
         self.start_time = datetime.now()
     
     def update_message_status(self, success: bool):
@@ -312,6 +507,8 @@ class HealthChecker:
         """Обновление статуса БД операций"""
         if success:
             self.last_db_operation = datetime.now()
+        else:
+            self.last_db_failure = datetime.now()
     
     def get_health_status(self) -> Dict:
         """Получение статуса здоровья бота"""
@@ -340,22 +537,38 @@ class HealthChecker:
         else:
             status['api_status'] = 'unknown'
         
-        if self.last_db_operation:
+        if self.last_db_failure and (not self.last_db_operation or self.last_db_failure > self.last_db_operation):
+            # Последняя операция с БД завершилась ошибкой
+            status['last_db_failure_seconds_ago'] = int((now - self.last_db_failure).total_seconds())
+            status['db_status'] = 'error'
+        elif self.last_db_operation:
             db_age = (now - self.last_db_operation).total_seconds()
             status['last_db_seconds_ago'] = int(db_age)
             status['db_status'] = 'healthy' if db_age < 3600 else 'warning'
         else:
             status['db_status'] = 'unknown'
         
-        # Общий статус
+        # Цикл событий: недавние блокировки дольше порога LoopLagMonitor
+        if self.loop_monitor is not None:
+            status['loop'] = self.loop_monitor.get_status()
+            status['loop_status'] = status['loop']['status']
+        
+        # Общий статус: заблокированный цикл важнее остальных проверок
         statuses = [status.get('message_status'), status.get('api_status'), status.get('db_status')]
-        if 'unknown' in statuses:
+        if status.get('loop_status') == 'degraded':
+            status['overall_status'] = 'degraded'
+        elif 'error' in statuses:
+            status['overall_status'] = 'unhealthy'
+        elif 'unknown' in statuses:
             status['overall_status'] = 'starting'
         elif 'warning' in statuses:
             status['overall_status'] = 'warning'
         else:
             status['overall_status'] = 'healthy'
         
+        # Задержки из реестра метрик: p50/p99 вместо одних только отметок времени
+        status['latency'] = {name: self.metrics.summary(name) for _, name in LATENCY_METRICS}
+        
         return status
     
     def log_health_report(self):
@@ -367,10 +580,20 @@ class HealthChecker:
         self.logger.log_info(f"📱 Статус сообщений: {health['message_status']}")
         self.logger.log_info(f"🌐 Статус API: {health['api_status']}")
         self.logger.log_info(f"💾 Статус БД: {health['db_status']}")
+        if 'loop_status' in health:
+            self.logger.log_info(f"🔄 Цикл событий: {health['loop_status']}, "
+                                 f"блокировок {health['loop']['blocked_total']}")
+        for title, name in LATENCY_METRICS:
+            summary = health['latency'][name]
+            if summary['count']:
+                self.logger.log_info(f"⏳ {title}: p50 {summary['p50'] * 1000:.0f} мс, "
+                                     f"p99 {summary['p99'] * 1000:.0f} мс ({summary['count']})")
         self.logger.log_info(f"🎯 Общий статус: {health['overall_status']}")
 
 # Пример использования
 if __name__ == "__main__":
+    import sqlite3
+    
     print("🧪 Тестирование системы логирования и обработки ошибок...")
     
     # Создаем логгер
@@ -395,6 +618,45 @@ if __name__ == "__main__":
     except Exception as e:
         error_handler.handle_telegram_error(e, "test_context")
     
+    # Тестируем автоматический выключатель
+    breaker = error_handler.circuit("/standings")
+    for _ in range(error_handler.circuit_failure_threshold):
+        breaker.record_failure()
+    print(f"🔌 После {error_handler.circuit_failure_threshold} ошибок: {breaker.state}, "
+          f"запрос разрешен: {breaker.allow_request()}")
+    breaker.cooldown = 0
+    print(f"🔌 После паузы: {breaker.state}, пробный запрос: {breaker.allow_request()}, "
+          f"второй: {breaker.allow_request()}")
+    breaker.record_success()
+    print(f"🔌 После успешного пробного запроса: {breaker.state}")
+    
+    # Тестируем повторы: три одновременных вызова с отдельными счетчиками попыток
+    failures = {}
+    
+    @error_handler_decorator(error_handler, "flaky_write", RetryPolicy(base_delay=0.05, deadline=5))
+    def flaky_write(call_id):
+        failures[call_id] = failures.get(call_id, 0) + 1
+        if failures[call_id] < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return call_id
+    
+    async def run_retries():
+        return await asyncio.gather(*(flaky_write(call_id) for call_id in range(3)))
+    
+    print(f"🔁 Результаты повторов: {asyncio.run(run_retries())}, попыток: {failures}")
+    
+    # Ошибки Telegram классифицируются по типу: RetryAfter, TimedOut и NetworkError повторяются
+    telegram_errors = [RetryAfter(0), TimedOut(), NetworkError("Connection reset by peer")]
+    
+    @error_handler_decorator(error_handler, "send_post", RetryPolicy(base_delay=0.01, deadline=5))
+    async def send_post():
+        if telegram_errors:
+            raise telegram_errors.pop(0)
+        return "sent"
+    
+    print(f"🔁 Отправка после RetryAfter, TimedOut и NetworkError: {asyncio.run(send_post())}")
+    print(f"🔁 BadRequest: {error_handler.handle_telegram_error(BadRequest('Chat not found'), 'test_context')}")
+    
     # Тестируем монитор здоровья
     health_checker.update_message_status(True)
     health_checker.update_api_status(True)
@@ -0,0 +1,494 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from api_cache import ApiCache
+from error_handler import CircuitOpenError, ErrorHandler
+
+logger = logging.getLogger(__name__)
+
+# Saudi Pro League в API-Football
+SAUDI_PRO_LEAGUE_ID = 307
+
+# Эндпоинты API-Football: название -> (путь, ответ свежий (мин), ответ еще можно отдать (мин))
+ENDPOINTS = {
+    'fixtures': ('/fixtures', 1, 30),
+    'teams': ('/teams', 24 * 60, 7 * 24 * 60),
+    'standings': ('/standings', 10, 6 * 60),
+    'scorers': ('/players/topscorers', 60, 24 * 60),
+}
+
+# Короткие статусы матча API-Football -> статус в таблице matches
+MATCH_STATUSES = {
+    'TBD': 'scheduled', 'NS': 'scheduled',
+    '1H': 'live', 'HT': 'live', '2H': 'live', 'ET': 'live', 'BT': 'live', 'P': 'live', 'LIVE': 'live',
+    'FT': 'finished', 'AET': 'finished', 'PEN': 'finished',
+    'PST': 'postponed', 'SUSP': 'postponed', 'INT': 'postponed',
+    'CANC': 'cancelled', 'ABD': 'cancelled', 'AWD': 'finished', 'WO': 'finished',
+}
+
+class APIError(Exception):
+    """Ошибка ответа внешнего API"""
+    
+    def __init__(self, endpoint: str, status: int, message: str = ""):
+        super().__init__(f"{endpoint}: HTTP {status} {message}".strip())
+        self.endpoint = endpoint
+        self.status = status
+
+class FootballAPIClient:
+    """Клиент API-Football поверх одной общей aiohttp.ClientSession
+    
+    Сессия создается при первом запросе и переиспользует соединения
+    (keep-alive) для всех запросов, число соединений и время ожидания
+    ограничены. Ответы проходят через двухуровневый ApiCache: одновременные
+    одинаковые запросы объединяются, а устаревший ответ отдается сразу и
+    обновляется в фоне.
+    
+    Если передан ErrorHandler, у каждого эндпоинта свой автоматический
+    выключатель: пока цепь разомкнута, запросы к API не выполняются, и
+    кэш отдает имеющиеся данные, не дожидаясь таймаутов.
+    """
+    
+    BASE_URL = "https://v3.football.api-sports.io"
+    
+    def __init__(self, async_db, api_key: Optional[str] = None, base_url: str = BASE_URL,
+                 timeout: float = 15.0, connect_timeout: float = 5.0,
+                 limit: int = 10, limit_per_host: int = 5, cache: Optional[ApiCache] = None,
+                 error_handler: Optional[ErrorHandler] = None):
+        self.async_db = async_db
+        self.error_handler = error_handler
+        self.cache = cache or ApiCache(async_db)
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
+    
+    async def _get_session(self):
+        """Общая сессия: создается лениво, чтобы aiohttp не загружался при старте бота"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            headers = {'x-apisports-key': self.api_key} if self.api_key else {}
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                raise_for_status=False
+            )
+        return self._session
+    
+    @staticmethod
+    def cache_key(params: Optional[Dict]) -> str:
+        """Ключ параметров запроса в api_cache"""
+        return json.dumps(params or {}, sort_keys=True)
+    
+    async def get_json(self, endpoint: str, params: Optional[Dict] = None, ttl_minutes: int = 10,
+                       hard_ttl_minutes: Optional[int] = None) -> Any:
+        """Ответ эндпоинта из кэша или, если его там нет, от API"""
+        data, _ = await self.get_json_versioned(endpoint, params, ttl_minutes, hard_ttl_minutes)
+        return data
+    
+    async def get_json_versioned(self, endpoint: str, params: Optional[Dict] = None, ttl_minutes: int = 10,
+                                 hard_ttl_minutes: Optional[int] = None) -> Tuple[Any, Optional[int]]:
+        """Ответ эндпоинта и его версия в кэше (см. ApiCache.get_versioned)"""
+        return await self.cache.get_versioned(endpoint, self.cache_key(params),
+                                              lambda validators: self._fetch(endpoint, params, validators),
+                                              ttl_minutes, hard_ttl_minutes)
+    
+    async def _fetch(self, endpoint: str, params: Optional[Dict], validators: Dict) -> Optional[Dict]:
+        """HTTP-запрос к API, условный при наличии валидаторов
+        
+        Возвращает None, если сервер ответил 304 Not Modified: тело не
+        скачивается и не разбирается.
+        """
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        breaker = self.error_handler.circuit(endpoint) if self.error_handler else None
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError(endpoint, breaker.retry_in())
+        
+        available = None
+        try:
+            result = await self._request(endpoint, params, headers)
+            available = True
+        except Exception as e:
+            # Ошибки запроса (4xx, кроме 429) не говорят о недоступности сервиса
+            if not isinstance(e, APIError) or e.status >= 500 or e.status == 429:
+                available = False
+            raise
+        finally:
+            if breaker is not None:
+                if available is None:
+                    # 4xx или отмена (CancelledError): состояние цепи не меняется
+                    breaker.release()
+                elif available:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+        return result
+    
+    async def _request(self, endpoint: str, params: Optional[Dict], headers: Dict) -> Optional[Dict]:
+        session = await self._get_session()
+        async with session.get(endpoint, params=params, headers=headers) as response:
+            if response.status == 304 and headers:
+                return None
+            if response.status != 200:
+                raise APIError(endpoint, response.status, response.reason or "")
+            return {
+                'data': await response.json(content_type=None),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша ответов API"""
+        return self.cache.get_stats()
+    
+    async def close(self):
+        """Закрытие сессии и всех соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("🔒 HTTP-сессия API закрыта")
+
+def _kickoff(iso_date: str) -> datetime:
+    """Время начала матча из ISO-строки API в локальном времени сервера"""
+    kickoff = datetime.fromisoformat(iso_date)
+    if kickoff.tzinfo is not None:
+        kickoff = kickoff.astimezone().replace(tzinfo=None)
+    return kickoff
+
+def parse_fixtures(payload: Dict, league_name: str) -> List[Dict]:
+    """Матчи из ответа /fixtures в формате save_match"""
+    matches = []
+    for item in payload.get('response', []):
+        fixture, teams, goals = item['fixture'], item['teams'], item.get('goals') or {}
+        kickoff = _kickoff(fixture['date'])
+        matches.append({
+            'api_id': str(fixture['id']),
+            'home_team': teams['home']['name'],
+            'away_team': teams['away']['name'],
+            'home_team_id': str(teams['home']['id']),
+            'away_team_id': str(teams['away']['id']),
+            'match_date': kickoff.strftime('%Y-%m-%d'),
+            'match_time': kickoff.strftime('%H:%M'),
+            'tournament': (item.get('league') or {}).get('name', league_name),
+            'status': MATCH_STATUSES.get(fixture['status']['short'], 'scheduled'),
+            'home_score': goals.get('home') or 0,
+            'away_score': goals.get('away') or 0,
+            'venue': (fixture.get('venue') or {}).get('name')
+        })
+    return matches
+
+def parse_teams(payload: Dict, league_name: str) -> List[Dict]:
+    """Команды из ответа /teams в формате save_team"""
+    teams = []
+    for item in payload.get('response', []):
+        team = item['team']
+        teams.append({
+            'api_id': str(team['id']),
+            'name': team['name'],
+            'league': league_name,
+            'country': team.get('country'),
+            'logo_url': team.get('logo'),
+            'founded': team.get('founded'),
+            'venue': (item.get('venue') or {}).get('name')
+        })
+    return teams
+
+def parse_standings(payload: Dict) -> List[Dict]:
+    """Строки турнирной таблицы из ответа /standings в формате get_league_standings"""
+    standings = []
+    for item in payload.get('response', []):
+        for group in item['league']['standings']:
+            for row in group:
+                totals = row['all']
+                standings.append({
+                    'name': row['team']['name'],
+                    'team_id': str(row['team']['id']),
+                    'position': row['rank'],
+                    'games': totals['played'],
+                    'wins': totals['win'],
+                    'draws': totals['draw'],
+                    'losses': totals['lose'],
+                    'goals_for': totals['goals']['for'],
+                    'goals_against': totals['goals']['against'],
+                    'goal_difference': row.get('goalsDiff'),
+                    'points': row['points']
+                })
+    return standings
+
+def parse_scorers(payload: Dict) -> List[Dict]:
+    """Игроки из ответа /players/topscorers в формате save_players_bulk"""
+    players = []
+    for item in payload.get('response', []):
+        player = item['player']
+        statistics = (item.get('statistics') or [{}])[0]
+        goals = statistics.get('goals') or {}
+        players.append({
+            'api_id': str(player['id']),
+            'name': player['name'],
+            'team': (statistics.get('team') or {}).get('name'),
+            'position': (statistics.get('games') or {}).get('position'),
+            'age': player.get('age'),
+            'nationality': player.get('nationality'),
+            'goals': goals.get('total') or 0,
+            'assists': goals.get('assists') or 0
+        })
+    return players
+
+class IngestionPipeline:
+    """Загрузка матчей, команд, таблицы и бомбардиров из API в БД
+    
+    Все эндпоинты запрашиваются одновременно через общую сессию клиента,
+    результаты записываются пакетными методами DatabaseManager. Ошибка
+    одного эндпоинта не мешает сохранить остальные.
+    """
+    
+    def __init__(self, client: FootballAPIClient, async_db, league_id: int = SAUDI_PRO_LEAGUE_ID,
+                 league_name: str = 'Saudi Pro League', season: Optional[int] = None,
+                 fixture_days: int = 7):
+        self.client = client
+        self.async_db = async_db
+        self.league_id = league_id
+        self.league_name = league_name
+        self.season = season
+        self.fixture_days = fixture_days
+        # Версии ответов, уже записанных в БД: тот же ответ не разбирается повторно
+        self._saved_versions: Dict[str, int] = {}
+    
+    def _season(self) -> int:
+        """Год начала текущего сезона (сезон начинается в августе)"""
+        if self.season:
+            return self.season
+        now = datetime.now()
+        return now.year if now.month >= 8 else now.year - 1
+    
+    async def _load(self, name: str, params: Dict) -> Tuple[Any, Optional[int]]:
+        """Ответ эндпоинта и его версия; версия не меняется при попадании в кэш и 304"""
+        endpoint, ttl_minutes, hard_ttl_minutes = ENDPOINTS[name]
+        return await self.client.get_json_versioned(endpoint, params, ttl_minutes, hard_ttl_minutes)
+    
+    async def run(self) -> Dict:
+        """Один цикл загрузки, возвращает количество записей и ошибки по эндпоинтам
+        
+        Ответы, которые с прошлого цикла не менялись (из кэша или 304), не
+        записываются повторно и перечислены в summary['unchanged'].
+        """
+        season = self._season()
+        league = {'league': self.league_id, 'season': season}
+        today = datetime.now().date()
+        
+        requests = {
+            'fixtures': dict(league, **{'from': (today - timedelta(days=1)).isoformat(),
+                                        'to': (today + timedelta(days=self.fixture_days)).isoformat()}),
+            'teams': league,
+            'standings': league,
+            'scorers': league,
+        }
+        
+        responses = await asyncio.gather(
+            *(self._load(name, params) for name, params in requests.items()),
+            return_exceptions=True
+        )
+        
+        summary = {'errors': {}, 'unchanged': []}
+        for name, response in zip(requests, responses):
+            if isinstance(response, CircuitOpenError):
+                summary['errors'][name] = str(response)
+                logger.warning(f"🔌 {name}: API недоступен, в кэше данных нет ({response})")
+                continue
+            if isinstance(response, Exception):
+                summary['errors'][name] = str(response)
+                logger.error(f"❌ Ошибка загрузки {name}: {response}")
+                continue
+            
+            payload, version = response
+            if version is not None and self._saved_versions.get(name) == version:
+                summary['unchanged'].append(name)
+                continue
+            
+            try:
+                summary[name] = await self._save(name, payload, season)
+            except Exception as e:
+                summary['errors'][name] = str(e)
+                logger.error(f"❌ Ошибка разбора {name}: {e}")
+                continue
+            if version is not None:
+                self._saved_versions[name] = version
+        
+        saved = {name: result for name, result in summary.items() if name not in ('errors', 'unchanged')}
+        logger.info(f"📥 Загрузка данных API: {saved}, без изменений: {summary['unchanged']}, "
+                    f"ошибок: {len(summary['errors'])}")
+        return summary
+    
+    async def _save(self, name: str, payload: Dict, season: int) -> Dict[str, int]:
+        """Запись ответа эндпоинта в БД"""
+        if name == 'fixtures':
+            return await self.async_db.save_matches_bulk(parse_fixtures(payload, self.league_name))
+        if name == 'teams':
+            return await self.async_db.save_teams_bulk(parse_teams(payload, self.league_name))
+        if name == 'standings':
+            return await self.async_db.save_standings_bulk(
+                parse_standings(payload), self.league_name, f"{season}/{season + 1}"
+            )
+        return await self.async_db.save_players_bulk(parse_scorers(payload))
+
+# Проверка загрузки на локальном сервере-заглушке
+if __name__ == "__main__":
+    import hashlib
+    
+    from aiohttp import web
+    
+    from async_database import AsyncDatabaseManager
+    from database_manager import DatabaseManager
+    
+    STUB_RESPONSES = {
+        '/fixtures': {'response': [{
+            'fixture': {'id': 1001, 'date': '2025-10-17T18:00:00+00:00',
+                        'venue': {'name': 'Kingdom Arena'}, 'status': {'short': 'NS'}},
+            'league': {'name': 'Pro League'},
+            'teams': {'home': {'id': 2932, 'name': 'Al-Hilal'}, 'away': {'id': 2939, 'name': 'Al-Nassr'}},
+            'goals': {'home': None, 'away': None}
+        }]},
+        '/teams': {'response': [
+            {'team': {'id': 2932, 'name': 'Al-Hilal', 'country': 'Saudi-Arabia', 'founded': 1957},
+             'venue': {'name': 'Kingdom Arena'}},
+            {'team': {'id': 2939, 'name': 'Al-Nassr', 'country': 'Saudi-Arabia', 'founded': 1955},
+             'venue': {'name': 'Al-Awwal Park'}}
+        ]},
+        '/standings': {'response': [{'league': {'standings': [[
+            {'rank': 1, 'team': {'id': 2932, 'name': 'Al-Hilal'}, 'points': 9, 'goalsDiff': 6,
+             'all': {'played': 3, 'win': 3, 'draw': 0, 'lose': 0, 'goals': {'for': 8, 'against': 2}}},
+            {'rank': 2, 'team': {'id': 2939, 'name': 'Al-Nassr'}, 'points': 7, 'goalsDiff': 4,
+             'all': {'played': 3, 'win': 2, 'draw': 1, 'lose': 0, 'goals': {'for': 7, 'against': 3}}}
+        ]]}}]},
+        '/players/topscorers': {'response': [{
+            'player': {'id': 874, 'name': 'Cristiano Ronaldo', 'age': 40, 'nationality': 'Portugal'},
+            'statistics': [{'team': {'name': 'Al-Nassr'}, 'games': {'position': 'Attacker'},
+                            'goals': {'total': 5, 'assists': 1}}]
+        }]},
+    }
+    
+    async def main():
+        print("🧪 Тестирование загрузки данных API...")
+        
+        requests_seen = []
+        
+        async def handler(request):
+            requests_seen.append(request.path)
+            etag = f'"{hashlib.sha256(request.path_qs.encode()).hexdigest()[:16]}"'
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status=304, headers={'ETag': etag})
+            return web.json_response(STUB_RESPONSES[request.path], headers={'ETag': etag})
+        
+        async def broken(request):
+            requests_seen.append(request.path)
+            return web.Response(status=503)
+        
+        async def slow(request):
+            await asyncio.sleep(10)
+            return web.json_response({})
+        
+        app = web.Application()
+        for path in STUB_RESPONSES:
+            app.router.add_get(path, handler)
+        app.router.add_get('/broken', broken)
+        app.router.add_get('/slow', slow)
+        app.router.add_get('/missing', lambda request: web.Response(status=404))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        db_manager = DatabaseManager(':memory:')
+        async_db = AsyncDatabaseManager(db_manager)
+        error_handler = ErrorHandler(logger, circuit_failure_threshold=3, circuit_cooldown=60)
+        client = FootballAPIClient(async_db, base_url=f"http://127.0.0.1:{port}", error_handler=error_handler)
+        pipeline = IngestionPipeline(client, async_db, season=2025)
+        
+        try:
+            summary = await pipeline.run()
+            print(f"✅ Первый цикл: {summary}")
+            summary = await pipeline.run()
+            assert sorted(summary['unchanged']) == sorted(ENDPOINTS)
+            print(f"✅ Запросов к серверу за два цикла: {len(requests_seen)} (второй цикл - из кэша, "
+                  f"без записи в БД: {summary['unchanged']})")
+            
+            requests_seen.clear()
+            params = {'league': 307, 'season': 2024}
+            results = await asyncio.gather(*(client.get_json('/standings', params) for _ in range(20)))
+            assert len(requests_seen) == 1 and all(result == results[0] for result in results)
+            print(f"✅ 20 одновременных запросов таблицы - 1 запрос к серверу, {client.get_stats()}")
+            
+            requests_seen.clear()
+            params = {'league': 307, 'season': 2023}
+            await client.get_json('/standings', params, ttl_minutes=0, hard_ttl_minutes=5)
+            stale = await client.get_json('/standings', params, ttl_minutes=0, hard_ttl_minutes=5)
+            assert stale == results[0] and len(requests_seen) == 1
+            await asyncio.sleep(0.2)
+            print(f"✅ Устаревший ответ отдан сразу, обновлен в фоне: запросов {len(requests_seen)}")
+            
+            await client.get_json('/standings', params, ttl_minutes=0, hard_ttl_minutes=5)
+            await asyncio.sleep(0.2)
+            assert client.get_stats()['not_modified'] == 2
+            print(f"✅ Обновления без изменений получили 304: {client.get_stats()['not_modified']}")
+            
+            requests_seen.clear()
+            outcomes = []
+            for attempt in range(6):
+                try:
+                    await client.get_json('/broken', {'attempt': attempt})
+                except (APIError, CircuitOpenError) as e:
+                    outcomes.append(type(e).__name__)
+            assert len(requests_seen) == 3
+            print(f"✅ Выключатель: {outcomes}, {error_handler.get_error_summary()['circuit_breakers']['/broken']}")
+            
+            # Отмененный пробный запрос и 404 освобождают место пробы, не меняя состояния цепи
+            for endpoint in ('/slow', '/missing'):
+                breaker = error_handler.circuit(endpoint)
+                for _ in range(error_handler.circuit_failure_threshold):
+                    breaker.record_failure()
+                breaker.cooldown = 0
+                probe = asyncio.create_task(client._fetch(endpoint, None, {}))
+                await asyncio.sleep(0.2)
+                probe.cancel()
+                try:
+                    await probe
+                except (asyncio.CancelledError, APIError):
+                    pass
+                assert breaker.state == breaker.HALF_OPEN and breaker.allow_request()
+                breaker.release()
+            print("✅ Отмененный пробный запрос и 404 не блокируют полуоткрытую цепь")
+            
+            restarted = FootballAPIClient(async_db, base_url=f"http://127.0.0.1:{port}")
+            await restarted.get_json('/teams', {'league': 307, 'season': 2025}, 24 * 60)
+            print(f"✅ Новый процесс читает кэш из БД: {restarted.get_stats()}")
+            print(f"📊 Кэш: {client.get_stats()}")
+            print(f"📊 Таблица: {db_manager.get_league_standings()}")
+            print(f"📊 Статистика БД: {db_manager.get_database_stats()}")
+        finally:
+            await client.close()
+            async_db.close()
+            db_manager.close()
+            await runner.cleanup()
+        
+        print("🎉 Тестирование завершено!")
+    
+    asyncio.run(main())
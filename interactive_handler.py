@@ -6,66 +6,54 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
 
+from async_database import AsyncDatabaseManager
+from schema_migrations import USER_SUBSCRIPTIONS_QUERY, apply_migrations
+from subscription_index import SubscriptionIndex
+
 class InteractiveHandler:
     """Обработчик интерактивных функций бота в стиле Матч ТВ"""
     
-    def __init__(self, db_path: str = 'match_tv_bot.db'):
+    def __init__(self, db_path: str = 'match_tv_bot.db', async_db: Optional[AsyncDatabaseManager] = None):
         self.db_path = db_path
         self.logger = logging.getLogger(__name__)
         self._init_user_database()
         
+        # Обратный индекс подписок для рассылки уведомлений без запросов к БД
+        self.subscription_index = SubscriptionIndex()
+        self._load_subscription_index()
+        
+        # Корутины обращаются к БД только через поток асинхронного фасада
+        self.async_db = async_db if async_db is not None else AsyncDatabaseManager()
+        self.async_db.interactive_handler = self
+    
     def _init_user_database(self):
-        """Инициализация базы данных пользователей"""
+        """Инициализация базы данных пользователей через общие миграции схемы"""
         try:
             conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Таблица подписок пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_subscriptions (
-                    user_id INTEGER,
-                    team_name TEXT,
-                    player_name TEXT,
-                    subscription_type TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1
-                )
-            ''')
-            
-            # Таблица пользовательских запросов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_requests (
-                    user_id INTEGER,
-                    request_type TEXT,
-                    request_data TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица пользовательских настроек
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id INTEGER PRIMARY KEY,
-                    language TEXT DEFAULT 'ru',
-                    notification_time TEXT DEFAULT '09:00',
-                    timezone TEXT DEFAULT 'UTC+3',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
+            apply_migrations(conn)
             conn.close()
             
         except Exception as e:
             self.logger.error(f"Ошибка инициализации базы данных пользователей: {e}")
+    
+    def _load_subscription_index(self):
+        """Загрузка индекса подписок из БД при старте"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            loaded = self.subscription_index.load(conn)
+            conn.close()
+            
+            self.logger.info(f"🔔 Загружено активных подписок в индекс: {loaded}")
+        
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки индекса подписок: {e}")
 
     async def handle_start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
         user_id = update.effective_user.id
         
         # Регистрируем пользователя
-        self._register_user(user_id)
+        await self.async_db.register_user(user_id)
         
         welcome_text = """🏆 Добро пожаловать в Saudi Football TV Bot!
 
@@ -168,7 +156,7 @@ class InteractiveHandler:
         team_info = self._get_team_detailed_info(team_name)
         
         # Проверяем, подписан ли пользователь на эту команду
-        is_subscribed = self._check_user_subscription(user_id, team_name, 'team')
+        is_subscribed = await self.async_db.check_user_subscription(user_id, team_name, 'team')
         
         keyboard = [
             [
@@ -230,7 +218,7 @@ class InteractiveHandler:
         player_info = self._get_player_detailed_info(player_name)
         
         # Проверяем, подписан ли пользователь на этого игрока
-        is_subscribed = self._check_user_subscription(user_id, player_name, 'player')
+        is_subscribed = await self.async_db.check_user_subscription(user_id, player_name, 'player')
         
         keyboard = [
             [
@@ -267,13 +255,13 @@ class InteractiveHandler:
         entity_name = self._get_entity_name_from_id(entity_type, entity_id)
         
         if action == "subscribe":
-            success = self._add_user_subscription(user_id, entity_name, entity_type)
+            success = await self.async_db.add_user_subscription(user_id, entity_name, entity_type)
             if success:
                 message = f"✅ Вы подписались на {entity_name}!\n\nТеперь вы будете получать уведомления о всех новостях, связанных с {entity_name}."
             else:
                 message = f"❌ Ошибка при подписке на {entity_name}. Попробуйте позже."
         else:  # unsubscribe
-            success = self._remove_user_subscription(user_id, entity_name, entity_type)
+            success = await self.async_db.remove_user_subscription(user_id, entity_name, entity_type)
             if success:
                 message = f"✅ Вы отписались от {entity_name}."
             else:
@@ -293,7 +281,7 @@ class InteractiveHandler:
     async def handle_my_subscriptions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка просмотра подписок пользователя"""
         user_id = update.effective_user.id
-        subscriptions = self._get_user_subscriptions(user_id)
+        subscriptions = await self.async_db.get_user_subscriptions(user_id)
         
         if not subscriptions:
             text = """🔔 МОИ ПОДПИСКИ
@@ -368,7 +356,7 @@ class InteractiveHandler:
     async def handle_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка настроек пользователя"""
         user_id = update.effective_user.id
-        settings = self._get_user_settings(user_id)
+        settings = await self.async_db.get_user_settings(user_id)
         
         settings_text = f"""⚙️ НАСТРОЙКИ
 
@@ -447,6 +435,8 @@ class InteractiveHandler:
             
             conn.commit()
             conn.close()
+            
+            self.subscription_index.add(user_id, entity_name, entity_type)
             return True
             
         except Exception as e:
@@ -474,6 +464,8 @@ class InteractiveHandler:
             
             conn.commit()
             conn.close()
+            
+            self.subscription_index.remove(user_id, entity_name, entity_type)
             return True
             
         except Exception as e:
@@ -511,11 +503,7 @@ class InteractiveHandler:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT team_name, player_name, subscription_type 
-                FROM user_subscriptions 
-                WHERE user_id = ? AND is_active = 1
-            ''', (user_id,))
+            cursor.execute(USER_SUBSCRIPTIONS_QUERY, (user_id,))
             
             rows = cursor.fetchall()
             conn.close()
@@ -568,30 +556,8 @@ class InteractiveHandler:
             return {}
 
     def get_subscribed_users(self, entity_name: str, entity_type: str) -> List[int]:
-        """Получение списка пользователей, подписанных на сущность"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            if entity_type == 'team':
-                cursor.execute('''
-                    SELECT DISTINCT user_id FROM user_subscriptions 
-                    WHERE team_name = ? AND subscription_type = ? AND is_active = 1
-                ''', (entity_name, entity_type))
-            else:  # player
-                cursor.execute('''
-                    SELECT DISTINCT user_id FROM user_subscriptions 
-                    WHERE player_name = ? AND subscription_type = ? AND is_active = 1
-                ''', (entity_name, entity_type))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [row[0] for row in rows]
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка получения подписчиков для {entity_name}: {e}")
-            return []
+        """Получение списка пользователей, подписанных на сущность (из индекса в памяти)"""
+        return self.subscription_index.get_subscribers(entity_name, entity_type)
 
     # Методы для получения информации о сущностях
     
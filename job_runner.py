@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class JobRunner:
+    """Выполнение периодических задач бота под контролем
+    
+    Каждая задача запускается не более чем в одном экземпляре: если
+    предыдущий запуск еще идет, новый пропускается. Запуск ограничен
+    таймаутом, его длительность и результат записываются, а при остановке
+    бота все незавершенные задачи отменяются.
+    
+    Если передано хранилище (AsyncDatabaseManager), время запусков
+    сохраняется в БД, и после перезапуска по нему решается, нужно ли
+    догонять пропущенный запуск, пропускать его или ждать.
+    """
+    
+    def __init__(self, store=None):
+        self.store = store
+        self._running: Dict[str, asyncio.Task] = {}
+        self._history: Dict[str, Dict] = {}
+        self._last_success: Dict[str, datetime] = {}
+        self._stopping = False
+    
+    async def load(self) -> int:
+        """Загрузка времени последних успешных запусков из хранилища"""
+        if self.store is not None:
+            self._last_success = await self.store.get_job_last_runs()
+        return len(self._last_success)
+    
+    def last_success(self, name: str) -> Optional[datetime]:
+        return self._last_success.get(name)
+    
+    def first_delay(self, name: str, interval: float, default: float) -> float:
+        """Пауза до первого запуска интервальной задачи после старта
+        
+        Если задача недавно выполнялась, ждем остаток интервала, а не
+        запускаем ее сразу при каждом перезапуске. Просроченная задача
+        выполняется один раз через обычную паузу default.
+        """
+        last = self.last_success(name)
+        if last is None:
+            return default
+        remaining = (last + timedelta(seconds=interval) - datetime.now()).total_seconds()
+        return max(default, remaining)
+    
+    def missed_run_action(self, name: str, scheduled_at: datetime, grace: timedelta) -> str:
+        """Что делать с запуском по расписанию scheduled_at после старта
+        
+        wait - запуск уже был (или еще не наступил), catch_up - пропущен
+        недавно и его стоит выполнить сейчас, skip - пропущен слишком давно.
+        """
+        now = datetime.now()
+        last = self.last_success(name)
+        if scheduled_at > now or (last is not None and last >= scheduled_at):
+            return 'wait'
+        if now - scheduled_at <= grace:
+            return 'catch_up'
+        return 'skip'
+    
+    @staticmethod
+    def last_occurrence(at: dt_time, weekday: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+        """Последний момент расписания "каждый день в at" (или в день недели weekday, 0 - понедельник)"""
+        now = now or datetime.now()
+        moment = datetime.combine(now.date(), at)
+        if weekday is not None:
+            moment -= timedelta(days=(now.weekday() - weekday) % 7)
+        if moment > now:
+            moment -= timedelta(days=7 if weekday is not None else 1)
+        return moment
+    
+    def job(self, name: str, func: Callable[[], Awaitable], timeout: float) -> Callable:
+        """Callback для JobQueue, запускающий func через run()"""
+        async def callback(context):
+            await self.run(name, func, timeout)
+        return callback
+    
+    def _record(self, name: str) -> Dict:
+        record = self._history.get(name)
+        if record is None:
+            record = self._history[name] = {
+                'runs': 0, 'ok': 0, 'errors': 0, 'timeouts': 0, 'skipped': 0, 'cancelled': 0,
+                'last_status': None, 'last_error': None, 'last_started': None,
+                'last_duration': 0.0, 'max_duration': 0.0
+            }
+        return record
+    
+    async def run(self, name: str, func: Callable[[], Awaitable], timeout: float) -> str:
+        """Запуск задачи, возвращает статус: ok, error, timeout, skipped или cancelled"""
+        record = self._record(name)
+        
+        if self._stopping:
+            return 'skipped'
+        
+        running = self._running.get(name)
+        if running is not None and not running.done():
+            record['skipped'] += 1
+            logger.warning(f"⏭️ Задача {name} еще выполняется, запуск пропущен")
+            return 'skipped'
+        
+        task = asyncio.create_task(asyncio.wait_for(func(), timeout), name=f"job:{name}")
+        self._running[name] = task
+        record['runs'] += 1
+        record['last_started'] = datetime.now()
+        started = time.monotonic()
+        status = 'cancelled'
+        
+        try:
+            await task
+            status = 'ok'
+            record['last_error'] = None
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            record['last_error'] = f"превышен таймаут {timeout}с"
+            logger.error(f"⏱️ Задача {name} прервана по таймауту {timeout}с")
+        except asyncio.CancelledError:
+            if not task.done():
+                # Отменили сам run(), а не задачу: отменяем и ее
+                task.cancel()
+                raise
+            # Задачу отменил shutdown(): это штатный результат, а не ошибка
+        except Exception as e:
+            status = 'error'
+            record['last_error'] = str(e)
+            logger.error(f"❌ Ошибка задачи {name}: {e}", exc_info=True)
+        finally:
+            duration = time.monotonic() - started
+            record['last_duration'] = duration
+            record['max_duration'] = max(record['max_duration'], duration)
+            self._finish(name, task, record, status)
+            REGISTRY.histogram('bot_job_duration_seconds', 'Длительность периодических задач', job=name).observe(duration)
+            REGISTRY.counter('bot_job_runs_total', 'Запуски периодических задач', job=name, status=status).inc()
+        
+        if status == 'ok':
+            self._last_success[name] = record['last_started']
+        if self.store is not None:
+            await self.store.save_job_run(name, record['last_started'], status)
+        
+        return status
+    
+    def _finish(self, name: str, task: asyncio.Task, record: Dict, status: str):
+        """Учет результата запуска"""
+        record['last_status'] = status
+        if status == 'ok':
+            record['ok'] += 1
+        elif status == 'error':
+            record['errors'] += 1
+        elif status == 'timeout':
+            record['timeouts'] += 1
+        elif status == 'cancelled':
+            record['cancelled'] += 1
+        
+        if self._running.get(name) is task:
+            del self._running[name]
+    
+    async def shutdown(self, timeout: float = 10.0):
+        """Отмена всех выполняющихся задач и ожидание их завершения"""
+        self._stopping = True
+        tasks = [task for task in self._running.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+            logger.info(f"🛑 Отменено выполняющихся задач: {len(tasks)}")
+    
+    def is_running(self, name: str) -> bool:
+        task = self._running.get(name)
+        return task is not None and not task.done()
+    
+    def running_count(self) -> int:
+        return sum(1 for task in self._running.values() if not task.done())
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """История запусков по задачам"""
+        return {name: dict(record) for name, record in self._history.items()}
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+class LoopLagMonitor:
+    """Задержка цикла событий и поиск блокирующих вызовов
+    
+    Корутина-пульс каждые interval секунд засыпает и измеряет, насколько
+    позже срока она проснулась: это задержка планирования, которую
+    испытывают все задачи цикла. Пока цикл заблокирован, пульс не может
+    ничего сообщить, поэтому за ним следит отдельный поток: если пульса нет
+    дольше threshold, поток снимает стек потока цикла событий и запоминает,
+    какая задача выполнялась. Цикл считается перегруженным (is_degraded),
+    пока с последней блокировки не прошло recovery секунд.
+    """
+    
+    def __init__(self, interval: float = 0.25, threshold: float = 0.5, recovery: float = 60.0,
+                 registry: Optional[MetricsRegistry] = None, max_events: int = 10):
+        self.interval = interval
+        self.threshold = threshold
+        self.recovery = recovery
+        self.events = deque(maxlen=max_events)
+        
+        registry = registry or REGISTRY
+        self.lag_seconds = registry.histogram('bot_event_loop_lag_seconds', 'Задержка планирования цикла событий')
+        self.last_lag = registry.gauge('bot_event_loop_lag_last_seconds', 'Последняя измеренная задержка цикла')
+        self.blocked_total = registry.counter('bot_event_loop_blocked_total',
+                                              'Блокировки цикла событий дольше порога')
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._captured_heartbeat: Optional[float] = None
+        self._last_blocked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+    
+    async def start(self):
+        """Запуск пульса в текущем цикле событий и потока-наблюдателя"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        
+        self._task = asyncio.create_task(self._pulse(), name="loop_lag_monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"🩺 Мониторинг цикла событий запущен (порог {self.threshold}с)")
+    
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.threshold)
+            self._watchdog = None
+    
+    async def _pulse(self):
+        """Измерение задержки: насколько позже interval проснулась корутина"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            previous, self._heartbeat = self._heartbeat, now
+            
+            self.lag_seconds.observe(lag)
+            self.last_lag.set(lag)
+            if lag < self.threshold:
+                continue
+            
+            self._last_blocked_at = now
+            self.blocked_total.inc()
+            if self.events and self._captured_heartbeat == previous:
+                # Стек уже снят наблюдателем во время блокировки: уточняем ее длительность
+                self.events[-1]['blocked_for'] = round(lag, 3)
+                logger.warning(f"🐢 Цикл событий был заблокирован {lag:.2f}с "
+                               f"(задача {self.events[-1]['task']})")
+            else:
+                logger.warning(f"🐢 Задержка цикла событий {lag:.2f}с")
+    
+    def _watch(self):
+        """Поток-наблюдатель: снимает стек цикла, пока тот заблокирован"""
+        while not self._stopping.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled >= self.threshold and self._captured_heartbeat != heartbeat:
+                self._captured_heartbeat = heartbeat
+                self._capture(stalled)
+    
+    def _capture(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+        
+        try:
+            task = asyncio.current_task(self._loop)
+            task_name = task.get_name() if task is not None else None
+        except RuntimeError:
+            task_name = None
+        
+        self.events.append({
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'blocked_for': round(stalled, 3),
+            'task': task_name or 'обратный вызов цикла',
+            'stack': stack
+        })
+        logger.warning(f"🐢 Цикл событий заблокирован уже {stalled:.2f}с, задача "
+                       f"{task_name or 'обратный вызов цикла'}:\n{stack}")
+    
+    def is_degraded(self) -> bool:
+        """Была ли блокировка дольше порога за последние recovery секунд (или идет сейчас)"""
+        now = time.monotonic()
+        if now - self._heartbeat - self.interval >= self.threshold and self._task is not None:
+            return True
+        return self._last_blocked_at is not None and now - self._last_blocked_at < self.recovery
+    
+    def get_status(self) -> Dict:
+        """Состояние для HealthChecker"""
+        summary = {
+            'status': 'degraded' if self.is_degraded() else 'healthy',
+            'last_lag_seconds': round(self.last_lag.value, 4),
+            'p99_lag_seconds': round(self.lag_seconds.quantile(0.99), 4),
+            'blocked_total': int(self.blocked_total.value)
+        }
+        if self.events:
+            last = self.events[-1]
+            summary['last_block'] = {key: last[key] for key in ('at', 'blocked_for', 'task')}
+        return summary
+    
+    def recent_blocks(self) -> List[Dict]:
+        return list(self.events)
+
+# Проверка: блокирующий вызов внутри корутины
+if __name__ == "__main__":
+    from error_handler import HealthChecker
+    
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
+    def load_table_synchronously():
+        time.sleep(0.8)
+    
+    async def blocking_job():
+        load_table_synchronously()
+    
+    async def main():
+        print("🧪 Тестирование мониторинга цикла событий...")
+        
+        monitor = LoopLagMonitor(interval=0.05, threshold=0.2, recovery=5)
+        health_checker = HealthChecker(logger, loop_monitor=monitor)
+        await monitor.start()
+        
+        await asyncio.sleep(0.3)
+        print(f"✅ Без блокировок: {health_checker.get_health_status()['loop_status']}")
+        
+        await asyncio.create_task(blocking_job(), name="blocking_job")
+        await asyncio.sleep(0.2)
+        
+        block = monitor.recent_blocks()[-1]
+        assert block['task'] == 'blocking_job' and 'load_table_synchronously' in block['stack']
+        health = health_checker.get_health_status()
+        print(f"✅ Блокировка {block['blocked_for']}с в задаче {block['task']}, "
+              f"loop_status={health['loop_status']}, overall_status={health['overall_status']}")
+        
+        await monitor.stop()
+        print("🎉 Тестирование завершено!")
+    
+    asyncio.run(main())
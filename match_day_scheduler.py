@@ -0,0 +1,127 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Фазы относительно начала матча (минуты): (фаза, начало, конец)
+MATCH_PHASES: List[Tuple[str, int, int]] = [
+    ('pre_match', -120, 0),
+    ('first_half', 0, 50),
+    ('half_time', 50, 65),
+    ('second_half', 65, 115),
+    ('full_time', 115, 145),
+]
+
+# При пересечении матчей действует фаза с наибольшим приоритетом
+PHASE_PRIORITY = ['full_time', 'half_time', 'first_half', 'second_half', 'pre_match', 'match_day', 'idle']
+
+PHASE_LABELS = {
+    'idle': 'день без матчей',
+    'match_day': 'игровой день',
+    'pre_match': 'перед матчем',
+    'first_half': 'первый тайм',
+    'half_time': 'перерыв',
+    'second_half': 'второй тайм',
+    'full_time': 'после матча',
+}
+
+# Интервалы задач по фазам (секунды); poll - частота опроса внешнего API
+CADENCE: Dict[str, Dict[str, int]] = {
+    'idle':        {'urgent_news': 3600, 'full_news': 7200, 'poll': 3600},
+    'match_day':   {'urgent_news': 1800, 'full_news': 3600, 'poll': 900},
+    'pre_match':   {'urgent_news': 900,  'full_news': 1800, 'poll': 300},
+    'first_half':  {'urgent_news': 600,  'full_news': 1800, 'poll': 60},
+    'half_time':   {'urgent_news': 300,  'full_news': 900,  'poll': 120},
+    'second_half': {'urgent_news': 600,  'full_news': 1800, 'poll': 60},
+    'full_time':   {'urgent_news': 300,  'full_news': 600,  'poll': 60},
+}
+
+# Минимальная пауза между запусками, чтобы неточные часы не давали всплесков
+MIN_DELAY_SECONDS = 30
+
+class MatchDayScheduler:
+    """Адаптивная частота задач по расписанию матчей из таблицы matches
+    
+    Вокруг начала матча, перерыва и финального свистка публикации и опрос
+    API учащаются, в игровой день без live-матчей идут реже, а в дни без
+    матчей бот почти простаивает.
+    """
+    
+    def __init__(self, async_db, lookahead_hours: int = 36):
+        self.async_db = async_db
+        self.lookahead_hours = lookahead_hours
+        self._kickoffs: List[datetime] = []
+        self._last_phase: Optional[str] = None
+    
+    async def refresh(self) -> int:
+        """Перечитывание ближайших матчей из БД, возвращает их количество"""
+        try:
+            now = datetime.now()
+            self._kickoffs = await self.async_db.get_match_kickoffs(
+                now - timedelta(hours=3), now + timedelta(hours=self.lookahead_hours)
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки расписания матчей: {e}")
+        return len(self._kickoffs)
+    
+    def phase(self, now: Optional[datetime] = None) -> str:
+        """Текущая фаза с учетом всех матчей"""
+        now = now or datetime.now()
+        
+        phases = set()
+        for kickoff in self._kickoffs:
+            minutes = (now - kickoff).total_seconds() / 60
+            for name, start, end in MATCH_PHASES:
+                if start <= minutes < end:
+                    phases.add(name)
+            if kickoff.date() == now.date():
+                phases.add('match_day')
+        
+        for name in PHASE_PRIORITY:
+            if name in phases:
+                return name
+        return 'idle'
+    
+    def _next_boundary(self, now: datetime) -> Optional[datetime]:
+        """Ближайший момент смены фазы: границы фаз матчей и полночь"""
+        boundaries = [datetime.combine(now.date() + timedelta(days=1), datetime.min.time())]
+        for kickoff in self._kickoffs:
+            for _, start, end in MATCH_PHASES:
+                boundaries.append(kickoff + timedelta(minutes=start))
+                boundaries.append(kickoff + timedelta(minutes=end))
+        future = [moment for moment in boundaries if moment > now]
+        return min(future) if future else None
+    
+    def interval(self, job: str, now: Optional[datetime] = None) -> int:
+        """Интервал задачи в текущей фазе"""
+        return CADENCE[self.phase(now)][job]
+    
+    def next_delay(self, job: str, now: Optional[datetime] = None) -> float:
+        """Пауза до следующего запуска задачи (секунды)
+        
+        Если до следующей фазы ближе, чем до очередного запуска, и в новой
+        фазе задача идет чаще, запуск переносится на границу фазы - так
+        начало матча не ждет окончания длинного интервала простоя.
+        """
+        now = now or datetime.now()
+        phase = self.phase(now)
+        if phase != self._last_phase:
+            logger.info(f"🗓️ Режим расписания: {PHASE_LABELS[phase]}")
+            self._last_phase = phase
+        
+        delay = CADENCE[phase][job]
+        boundary = self._next_boundary(now)
+        if boundary is not None:
+            until_boundary = (boundary - now).total_seconds()
+            if until_boundary < delay and self.interval(job, boundary) < delay:
+                delay = until_boundary
+        
+        return max(MIN_DELAY_SECONDS, delay)
+    
+    def describe(self, now: Optional[datetime] = None) -> str:
+        """Текущий режим для /stats"""
+        phase = self.phase(now)
+        cadence = CADENCE[phase]
+        return (f"{PHASE_LABELS[phase]} (срочные - каждые {cadence['urgent_news'] // 60} мин, "
+                f"полные - каждые {cadence['full_news'] // 60} мин)")
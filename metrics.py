@@ -0,0 +1,261 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек по умолчанию (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Гистограммы задержек бота для /stats и HealthChecker: (название, имя метрики)
+LATENCY_METRICS = (
+    ('обработчики', 'bot_handler_latency_seconds'),
+    ('запросы к БД', 'bot_db_query_seconds'),
+    ('отправка', 'bot_send_latency_seconds'),
+    ('отрисовка', 'bot_render_seconds'),
+    ('задачи', 'bot_job_duration_seconds'),
+    ('цикл событий', 'bot_event_loop_lag_seconds'),
+)
+
+class Counter:
+    """Монотонно растущий счетчик"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, help: str = '', labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+class Gauge:
+    """Текущее значение, которое может расти и уменьшаться
+    
+    Вместо явной установки значение можно вычислять при чтении через
+    set_function (например, длину очереди).
+    """
+    
+    kind = 'gauge'
+    
+    def __init__(self, name: str, help: str = '', labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+    
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+    
+    def set(self, value: float):
+        self._value = value
+    
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+class Timer:
+    """Контекстный менеджер, записывающий длительность блока в гистограмму"""
+    
+    __slots__ = ('histogram', 'started')
+    
+    def __init__(self, histogram: 'Histogram'):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами
+    
+    Запись - бинарный поиск по неизменному набору границ и увеличение
+    одного счетчика, поэтому стоит одинаково при любом числе наблюдений.
+    Квантили оцениваются по корзинам с линейной интерполяцией внутри корзины.
+    """
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, help: str = '', labels: Optional[Dict[str, str]] = None,
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(sorted(buckets))
+        # Последняя корзина - все значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+    
+    def time(self) -> Timer:
+        return Timer(self)
+    
+    def quantile(self, q: float) -> float:
+        return quantile(self.buckets, self.counts, q, self.max)
+
+def quantile(buckets: Tuple[float, ...], counts: List[int], q: float, maximum: float = 0.0) -> float:
+    """Оценка квантиля q по числу наблюдений в корзинах"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if index == len(buckets):
+                # Корзина +Inf: верхней границы нет, лучшая оценка - максимум
+                return maximum
+            lower = buckets[index - 1] if index > 0 else 0.0
+            upper = min(buckets[index], maximum) if maximum > lower else buckets[index]
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return maximum
+
+class MetricsRegistry:
+    """Реестр метрик бота: счетчики, значения и гистограммы
+    
+    Метрика определяется именем и набором меток; повторный запрос с теми же
+    именем и метками возвращает тот же объект, поэтому на горячих путях
+    метрику стоит получить один раз и хранить.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, tuple], object] = {}
+        self._lock = threading.Lock()
+    
+    def _get(self, cls, name: str, help: str, labels: Dict[str, str], **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(name, help, labels, **kwargs)
+        return metric
+    
+    def counter(self, name: str, help: str = '', **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+    
+    def gauge(self, name: str, help: str = '', **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+    
+    def histogram(self, name: str, help: str = '', buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+    
+    def collect(self) -> List:
+        """Все метрики, сгруппированные по имени"""
+        return sorted(self._metrics.values(), key=lambda metric: (metric.name, sorted(metric.labels.items())))
+    
+    def value(self, name: str) -> float:
+        """Сумма значений счетчиков или gauge с именем name по всем меткам"""
+        return sum(metric.value for metric in self._metrics.values()
+                   if metric.name == name and metric.kind != 'histogram')
+    
+    def summary(self, name: str) -> Dict[str, float]:
+        """Количество, p50 и p99 гистограммы name, объединенной по всем меткам"""
+        histograms = [metric for metric in self._metrics.values()
+                      if metric.name == name and metric.kind == 'histogram']
+        if not histograms:
+            return {'count': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        
+        counts = [sum(column) for column in zip(*(histogram.counts for histogram in histograms))]
+        maximum = max(histogram.max for histogram in histograms)
+        buckets = histograms[0].buckets
+        return {
+            'count': sum(counts),
+            'p50': quantile(buckets, counts, 0.5, maximum),
+            'p99': quantile(buckets, counts, 0.99, maximum),
+            'max': maximum
+        }
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items())
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def render_prometheus(registry: 'MetricsRegistry') -> str:
+    """Все метрики реестра в текстовом формате Prometheus (version 0.0.4)"""
+    lines = []
+    described = set()
+    for metric in registry.collect():
+        if metric.name not in described:
+            described.add(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+        
+        if metric.kind != 'histogram':
+            lines.append(f"{metric.name}{_format_labels(metric.labels)} {_format_value(metric.value)}")
+            continue
+        
+        cumulative = 0
+        for bound, count in zip(metric.buckets + (math.inf,), metric.counts):
+            cumulative += count
+            labels = _format_labels(metric.labels, ('le', _format_value(bound)))
+            lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+        lines.append(f"{metric.name}_sum{_format_labels(metric.labels)} {_format_value(metric.sum)}")
+        lines.append(f"{metric.name}_count{_format_labels(metric.labels)} {metric.count}")
+    
+    return '\n'.join(lines) + '\n'
+
+# Общий реестр процесса
+REGISTRY = MetricsRegistry()
+
+# Проверка оценки квантилей
+if __name__ == "__main__":
+    import random
+    
+    print("🧪 Тестирование метрик...")
+    
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_latency_seconds', 'Тестовая задержка', handler='test')
+    values = [random.expovariate(1 / 0.05) for _ in range(100000)]
+    
+    started = time.perf_counter()
+    for value in values:
+        histogram.observe(value)
+    per_observation = (time.perf_counter() - started) / len(values)
+    
+    values.sort()
+    for q in (0.5, 0.99):
+        print(f"📊 p{int(q * 100)}: оценка {histogram.quantile(q) * 1000:.1f} мс, "
+              f"точно {values[int(q * len(values))] * 1000:.1f} мс")
+    print(f"⏱️ Запись одного наблюдения: {per_observation * 1e6:.2f} мкс")
+    print(f"✅ Сводка: {registry.summary('test_latency_seconds')}")
+    
+    registry.counter('test_requests_total', 'Тестовые запросы', path='/a"b').inc(3)
+    registry.gauge('test_queue_depth', 'Тестовая очередь').set_function(lambda: 7)
+    print(render_prometheus(registry))
+    
+    print("🎉 Тестирование завершено!")
@@ -0,0 +1,124 @@
+import json
+import logging
+from typing import Awaitable, Callable, Iterable, Optional
+
+from metrics import REGISTRY, MetricsRegistry, render_prometheus
+
+logger = logging.getLogger(__name__)
+
+# Статусы HealthChecker, при которых /healthz отвечает 200
+HEALTHY_STATUSES = ('healthy', 'starting', 'warning')
+
+class MetricsServer:
+    """HTTP-сервер метрик в цикле событий бота
+    
+    /metrics отдает реестр в текстовом формате Prometheus, /healthz - статус
+    HealthChecker в JSON (503, если статус не из HEALTHY_STATUSES). Перед
+    каждым ответом /metrics выполняются collectors: асинхронные функции,
+    которые обновляют метрики, требующие запроса (например, размер outbox
+    в БД). Перед ответом /healthz выполняются probes - проверки, которые
+    сообщают результат в HealthChecker (например, доступность БД).
+    aiohttp загружается только при запуске сервера.
+    """
+    
+    def __init__(self, registry: Optional[MetricsRegistry] = None, health_checker=None,
+                 host: str = '0.0.0.0', port: int = 9090,
+                 collectors: Iterable[Callable[[], Awaitable]] = (),
+                 probes: Iterable[Callable[[], Awaitable]] = ()):
+        self.registry = registry or REGISTRY
+        self.health_checker = health_checker
+        self.host = host
+        self.port = port
+        self.collectors = list(collectors)
+        self.probes = list(probes)
+        self._runner = None
+    
+    async def start(self):
+        from aiohttp import web
+        
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/healthz', self._healthz)
+        
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # При port=0 порт выбирает система
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"📈 Метрики доступны на http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("🔒 Сервер метрик остановлен")
+    
+    async def _run_all(self, functions, what: str):
+        for function in functions:
+            try:
+                await function()
+            except Exception as e:
+                logger.error(f"❌ Ошибка {what}: {e}")
+    
+    async def _metrics(self, request):
+        from aiohttp import web
+        
+        await self._run_all(self.collectors, 'сбора метрик')
+        return web.Response(text=render_prometheus(self.registry),
+                            content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    
+    async def _healthz(self, request):
+        from aiohttp import web
+        
+        if self.health_checker is None:
+            return web.json_response({'overall_status': 'unknown'}, status=503)
+        
+        await self._run_all(self.probes, 'проверки здоровья')
+        health = self.health_checker.get_health_status()
+        status = 200 if health['overall_status'] in HEALTHY_STATUSES else 503
+        return web.json_response(health, status=status, dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+# Проверка сервера на случайном порту
+if __name__ == "__main__":
+    import asyncio
+    
+    from aiohttp import ClientSession
+    
+    from error_handler import HealthChecker
+    
+    async def main():
+        print("🧪 Тестирование сервера метрик...")
+        
+        REGISTRY.counter('bot_posts_sent_total', 'Опубликованные посты').inc(3)
+        REGISTRY.histogram('bot_send_latency_seconds', 'Время запроса send_message к Telegram').observe(0.12)
+        depth = REGISTRY.gauge('bot_outbox_messages', 'Сообщения outbox по статусам', status='pending')
+        
+        async def collect_outbox():
+            depth.set(5)
+        
+        health_checker = HealthChecker(logger)
+        
+        async def probe_database():
+            # БД недоступна: /healthz должен ответить 503
+            health_checker.update_db_status(False)
+        
+        server = MetricsServer(health_checker=health_checker, host='127.0.0.1', port=0,
+                               collectors=[collect_outbox], probes=[probe_database])
+        await server.start()
+        try:
+            async with ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{server.port}/metrics") as response:
+                    text = await response.text()
+                    print(f"✅ /metrics: {response.status}, {len(text.splitlines())} строк")
+                    print('\n'.join(line for line in text.splitlines() if 'outbox' in line or 'posts' in line))
+                async with session.get(f"http://127.0.0.1:{server.port}/healthz") as response:
+                    health = await response.json()
+                    print(f"✅ /healthz: {response.status}, {health['overall_status']}")
+        finally:
+            await server.stop()
+        
+        print("🎉 Тестирование завершено!")
+    
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повтор не имеет смысла (бот заблокирован, чат удален, неверный текст)
+PERMANENT_ERRORS = (Forbidden, BadRequest)
+
+class OutboxWorker:
+    """Доставка сообщений из постоянной очереди outbox
+    
+    Посты и уведомления сначала записываются в SQLite с ключом
+    идемпотентности, а затем отправляются через BroadcastEngine. Повторная
+    постановка того же сообщения игнорируется, неудачные попытки
+    повторяются с экспоненциальной задержкой, а после перезапуска очередь
+    продолжает отправку с того места, где остановилась.
+    """
+    
+    def __init__(self, async_db, broadcaster, batch_size: int = 100, max_attempts: int = 5,
+                 base_delay: float = 30.0, max_delay: float = 3600.0):
+        self.async_db = async_db
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._drain_lock = asyncio.Lock()
+    
+    async def enqueue(self, messages: Iterable[Dict]) -> int:
+        """Постановка сообщений (idempotency_key, chat_id, text, message_type) в очередь"""
+        return await self.async_db.enqueue_outbox(list(messages))
+    
+    def _retry_at(self, attempts: int) -> datetime:
+        """Время следующей попытки: base_delay * 2^(попытка - 1), не больше max_delay"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return datetime.now() + timedelta(seconds=delay)
+    
+    async def drain(self) -> Dict:
+        """Отправка всех готовых сообщений очереди
+        
+        Одновременно работает только одна выгрузка, поэтому одно и то же
+        сообщение не может быть захвачено двумя задачами. Если выгрузку
+        прервали (таймаут задачи или остановка бота), захваченные, но не
+        отправленные сообщения сразу возвращаются в очередь, а не ждут
+        следующего перезапуска.
+        """
+        totals = {'sent': 0, 'failed': 0, 'retry_scheduled': 0, 'sent_by_type': {}}
+        
+        async def before_send(item: Tuple):
+            await self.async_db.mark_outbox_sending(item[2]['id'])
+        
+        async def on_result(item: Tuple, error: Optional[Exception]):
+            row = item[2]
+            if error is None:
+                await self.async_db.mark_outbox_sent(row['id'])
+                totals['sent'] += 1
+                by_type = totals['sent_by_type']
+                by_type[row['message_type']] = by_type.get(row['message_type'], 0) + 1
+                return
+            
+            attempts = row['attempts'] + 1
+            if isinstance(error, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+                await self.async_db.mark_outbox_failed(row['id'], str(error))
+                totals['failed'] += 1
+            else:
+                await self.async_db.mark_outbox_failed(row['id'], str(error), self._retry_at(attempts))
+                totals['retry_scheduled'] += 1
+        
+        async with self._drain_lock:
+            try:
+                while True:
+                    batch = await self.async_db.claim_outbox_batch(self.batch_size)
+                    if not batch:
+                        break
+                
+                    await self.broadcaster.broadcast(
+                        ((row['chat_id'], row['text'], row) for row in batch),
+                        before_send=before_send,
+                        on_result=on_result
+                    )
+            except (asyncio.CancelledError, Exception):
+                await self._release_claimed()
+                raise
+        
+        if totals['sent'] or totals['failed'] or totals['retry_scheduled']:
+            logger.info(
+                f"📤 Outbox: отправлено {totals['sent']}, ошибок {totals['failed']}, "
+                f"отложено {totals['retry_scheduled']}"
+            )
+        
+        return totals
+
+    async def _release_claimed(self):
+        """Возврат сообщений прерванной выгрузки в очередь
+        
+        Пока держится _drain_lock, все сообщения в статусах 'claimed' и
+        'sending' принадлежат этой выгрузке, поэтому их восстанавливает
+        recover_outbox(), как после аварийной остановки.
+        """
+        try:
+            # shield: повторная отмена не должна прервать восстановление
+            await asyncio.shield(self.async_db.recover_outbox())
+        except Exception as e:
+            logger.error(f"❌ Не удалось вернуть сообщения outbox в очередь: {e}")
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class RenderCache:
+    """Кэш отрисованных изображений: LRU в памяти и PNG-файлы на диске
+    
+    Ключ - хэш исходных данных и параметров отрисовки, поэтому одинаковая
+    таблица рисуется один раз, а после перезапуска бота берется с диска.
+    Изображения устаревшей таблицы по новому ключу уже не находятся, поэтому
+    кэш не очищается при изменении данных: на диске хранится не больше
+    max_files последних использованных файлов.
+    """
+    
+    def __init__(self, cache_dir: str = 'render_cache', max_entries: int = 16, max_files: int = 64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(data: Any, options: Dict) -> str:
+        """Ключ кэша по содержимому данных и параметрам отрисовки"""
+        payload = json.dumps({'data': data, 'options': options}, ensure_ascii=False,
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Изображение из памяти или с диска (None, если его еще нет)"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+        
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+            # Время изменения - отметка последнего использования для prune()
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения изображения из кэша: {e}")
+            return None
+        
+        with self._lock:
+            self.hits += 1
+            self._remember(key, data)
+        return data
+    
+    def put(self, key: str, data: bytes):
+        """Сохранение изображения в памяти и на диске"""
+        with self._lock:
+            self._remember(key, data)
+        
+        try:
+            # Запись через временный файл: читатель не увидит недописанный PNG
+            tmp_path = f"{self._path(key)}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи изображения в кэш: {e}")
+            return
+        
+        self.prune()
+    
+    def _remember(self, key: str, data: bytes):
+        """Добавление в LRU с вытеснением самых старых записей (под блокировкой)"""
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def prune(self) -> int:
+        """Удаление давно не использованных файлов сверх max_files, возвращает число удаленных"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.png'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass
+        
+        removed = 0
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        
+        if removed:
+            logger.info(f"🧹 Из кэша изображений удалено старых файлов: {removed}")
+        return removed
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика кэша"""
+        with self._lock:
+            return {'entries': len(self._memory), 'hits': self.hits, 'misses': self.misses}
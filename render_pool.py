@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class RenderQueueFull(Exception):
+    """Очередь отрисовки заполнена"""
+    pass
+
+def _start_method() -> str:
+    """forkserver, а где его нет - spawn
+    
+    fork копирует процесс вместе с блокировками, которые в этот момент
+    держат другие потоки (поток БД, наблюдатель цикла, потоки PTB), и
+    дочерний процесс может навсегда зависнуть на такой блокировке.
+    """
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def _init_worker(pids, initializer: Optional[Callable], initargs: tuple):
+    """Регистрация процесса в пуле и пользовательская инициализация"""
+    pids.put(os.getpid())
+    if initializer is not None:
+        initializer(*initargs)
+
+class RenderPool:
+    """Пул процессов для отрисовки изображений вне цикла событий
+    
+    Число ожидающих и выполняющихся задач ограничено max_pending: при
+    всплеске запросов лишние сразу получают RenderQueueFull, а не копятся в
+    очереди. Каждая задача ограничена timeout; после зависшей задачи пул
+    заменяется новым, а старый завершается, когда доработают его остальные
+    задачи (см. _restart).
+    """
+    
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, timeout: float = 30.0,
+                 initializer: Optional[Callable] = None, initargs: tuple = ()):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self._context = multiprocessing.get_context(_start_method())
+        self._pending = 0
+        self._retiring: Set[asyncio.Task] = set()
+        self._retired_pids: List[int] = []
+        self._executor, self._worker_pids, self._inflight = self._create_executor()
+    
+    @property
+    def pending(self) -> int:
+        """Число ожидающих и выполняющихся задач"""
+        return self._pending
+    
+    def _create_executor(self):
+        # Процессы сообщают свои PID через очередь: так их можно завершить без
+        # обращения к внутренностям ProcessPoolExecutor
+        worker_pids = self._context.SimpleQueue()
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context,
+                                       initializer=_init_worker,
+                                       initargs=(worker_pids, self.initializer, self.initargs))
+        return executor, worker_pids, set()
+    
+    async def submit(self, func: Callable, *args) -> Any:
+        """Выполнение func(*args) в процессе пула с ожиданием результата"""
+        if self._pending >= self.max_pending:
+            raise RenderQueueFull(f"В очереди отрисовки уже {self._pending} задач")
+        
+        self._pending += 1
+        try:
+            executor, inflight = self._executor, self._inflight
+            future = executor.submit(func, *args)
+            inflight.add(future)
+            future.add_done_callback(inflight.discard)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"❌ Отрисовка не уложилась в {self.timeout}с, пул перезапускается")
+                # Пул уже мог быть заменен из-за другой зависшей задачи
+                if executor is self._executor:
+                    self._restart(future)
+                raise
+        finally:
+            self._pending -= 1
+    
+    def _restart(self, hung: Future):
+        """Замена пула после зависшей задачи
+        
+        ProcessPoolExecutor не умеет отменять уже выполняющуюся задачу,
+        поэтому новые задачи сразу идут в новый пул, а старый закрывается
+        для приема и дорабатывает остальные принятые задачи. Их ожидающие
+        сами ограничены timeout, поэтому не позже чем через timeout процессы
+        старого пула (и зависший среди них) завершаются.
+        """
+        self._executor.shutdown(wait=False)
+        # PID собираются сразу, чтобы shutdown() мог завершить процессы, даже
+        # если _retire так и не начнет выполняться
+        pids = self._drain_pids(self._worker_pids)
+        self._retired_pids.extend(pids)
+        inflight = self._inflight
+        self._executor, self._worker_pids, self._inflight = self._create_executor()
+        
+        task = asyncio.create_task(self._retire(pids, inflight, hung))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+    
+    async def _retire(self, pids: List[int], inflight: Set[Future], hung: Future):
+        others = [asyncio.wrap_future(future) for future in inflight if future is not hung]
+        if others:
+            await asyncio.wait(others, timeout=self.timeout)
+        
+        self._terminate(pids)
+        for pid in pids:
+            self._retired_pids.remove(pid)
+    
+    @staticmethod
+    def _drain_pids(worker_pids) -> List[int]:
+        pids = []
+        while not worker_pids.empty():
+            pids.append(worker_pids.get())
+        return pids
+    
+    @staticmethod
+    def _terminate(pids: List[int]):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    async def cancel_retiring(self):
+        """Отмена ожидания старых пулов; вызывается, пока цикл событий еще работает
+        
+        Процессы отмененных пулов остаются в _retired_pids и завершаются в shutdown().
+        """
+        tasks = list(self._retiring)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def shutdown(self):
+        """Остановка пула процессов, в том числе после закрытия цикла событий"""
+        for task in self._retiring:
+            # В закрытом цикле cancel() бросает RuntimeError; процессы такого пула
+            # все равно завершаются ниже
+            if not task.get_loop().is_closed():
+                task.cancel()
+        # Пулы, которые еще дожидались своих задач, завершаются сразу
+        self._terminate(self._retired_pids)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("🔒 Пул отрисовки остановлен")
@@ -0,0 +1,368 @@
+import sqlite3
+import logging
+import sys
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Упорядоченные миграции схемы: (версия, название, список SQL-команд).
+# Новые изменения схемы добавляются только в конец списка с версией +1.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Базовые таблицы бота", [
+        # Таблица для команд
+        '''
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_id TEXT UNIQUE,
+            name TEXT NOT NULL,
+            league TEXT,
+            country TEXT,
+            logo_url TEXT,
+            founded INTEGER,
+            venue TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица для матчей
+        '''
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_id TEXT UNIQUE,
+            home_team TEXT NOT NULL,
+            away_team TEXT NOT NULL,
+            home_team_id TEXT,
+            away_team_id TEXT,
+            match_date TEXT,
+            match_time TEXT,
+            tournament TEXT,
+            tv_channel TEXT,
+            status TEXT DEFAULT 'scheduled',
+            home_score INTEGER DEFAULT 0,
+            away_score INTEGER DEFAULT 0,
+            venue TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица для новостей с улучшенной структурой
+        '''
+        CREATE TABLE IF NOT EXISTS news (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT,
+            summary TEXT,
+            news_type TEXT,
+            source TEXT,
+            tags TEXT,
+            importance INTEGER DEFAULT 1,
+            published_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_published BOOLEAN DEFAULT FALSE,
+            publish_count INTEGER DEFAULT 0,
+            UNIQUE(title, news_type)
+        )
+        ''',
+        # Таблица для турнирной таблицы
+        '''
+        CREATE TABLE IF NOT EXISTS league_table (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_name TEXT NOT NULL,
+            team_id TEXT,
+            position INTEGER,
+            games_played INTEGER,
+            wins INTEGER,
+            draws INTEGER,
+            losses INTEGER,
+            goals_for INTEGER,
+            goals_against INTEGER,
+            goal_difference INTEGER,
+            points INTEGER,
+            league TEXT,
+            season TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(team_name, league, season)
+        )
+        ''',
+        # Таблица для игроков
+        '''
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_id TEXT UNIQUE,
+            name TEXT NOT NULL,
+            team TEXT,
+            position TEXT,
+            age INTEGER,
+            nationality TEXT,
+            goals INTEGER DEFAULT 0,
+            assists INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица для кэширования API запросов
+        '''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint TEXT NOT NULL,
+            params TEXT,
+            response_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            UNIQUE(endpoint, params)
+        )
+        ''',
+        # Таблица для статистики бота
+        '''
+        CREATE TABLE IF NOT EXISTS bot_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stat_type TEXT NOT NULL,
+            stat_value TEXT,
+            date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица подписок пользователей
+        '''
+        CREATE TABLE IF NOT EXISTS user_subscriptions (
+            user_id INTEGER,
+            team_name TEXT,
+            player_name TEXT,
+            subscription_type TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+        ''',
+        # Таблица пользовательских запросов
+        '''
+        CREATE TABLE IF NOT EXISTS user_requests (
+            user_id INTEGER,
+            request_type TEXT,
+            request_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица пользовательских настроек
+        '''
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            language TEXT DEFAULT 'ru',
+            notification_time TEXT DEFAULT '09:00',
+            timezone TEXT DEFAULT 'UTC+3',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "Индексы для горячих запросов", [
+        # get_today_matches: WHERE match_date = ? ORDER BY match_time
+        "CREATE INDEX IF NOT EXISTS idx_matches_date_time ON matches(match_date, match_time)",
+        # get_unpublished_news: WHERE is_published = FALSE ORDER BY importance DESC, published_date DESC
+        "CREATE INDEX IF NOT EXISTS idx_news_unpublished ON news(is_published, importance DESC, published_date DESC)",
+        # get_league_standings: WHERE league = ? ORDER BY position
+        "CREATE INDEX IF NOT EXISTS idx_league_table_league_position ON league_table(league, position)",
+        # clean_old_cache: DELETE ... WHERE expires_at < ?
+        "CREATE INDEX IF NOT EXISTS idx_api_cache_expires ON api_cache(expires_at)",
+        # get_subscribed_users по команде и по игроку
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_team ON user_subscriptions(team_name, subscription_type, is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_player ON user_subscriptions(player_name, subscription_type, is_active)",
+        # _get_user_subscriptions / _check_user_subscription
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON user_subscriptions(user_id, is_active)",
+    ]),
+    (3, "Outbox для постов и уведомлений", [
+        # status: pending -> claimed -> sending -> sent | failed | unknown
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            chat_id INTEGER NOT NULL,
+            message_type TEXT DEFAULT 'post',
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        ''',
+        # claim_outbox_batch: WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)",
+    ]),
+    (4, "file_id загруженных изображений", [
+        # Ключ - хэш изображения из RenderCache, повторная отправка идет по file_id
+        '''
+        CREATE TABLE IF NOT EXISTS image_files (
+            image_hash TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (5, "Последние запуски периодических задач", [
+        # По last_success_at после перезапуска решается: догонять, пропускать или ждать
+        '''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_name TEXT PRIMARY KEY,
+            last_success_at TIMESTAMP,
+            last_attempt_at TIMESTAMP,
+            last_status TEXT
+        )
+        ''',
+    ]),
+    (6, "Мягкий срок жизни кэша API", [
+        # До fresh_until ответ свежий, до expires_at его еще можно отдать, обновляя в фоне
+        "ALTER TABLE api_cache ADD COLUMN fresh_until TIMESTAMP",
+    ]),
+    (7, "Валидаторы HTTP для кэша API", [
+        # ETag и Last-Modified ответа: обновление кэша идет условным запросом
+        "ALTER TABLE api_cache ADD COLUMN etag TEXT",
+        "ALTER TABLE api_cache ADD COLUMN last_modified TEXT",
+    ]),
+    (8, "Приоритет постов в outbox", [
+        # claim_outbox_batch: посты канала захватываются раньше накопившихся уведомлений
+        "CREATE INDEX IF NOT EXISTS idx_outbox_type_due ON outbox(status, message_type, next_attempt_at)",
+    ]),
+]
+
+# Горячие запросы. Их выполняют DatabaseManager и InteractiveHandler, а
+# find_table_scans проверяет планы тех же строк
+TODAY_MATCHES_QUERY = '''
+    SELECT home_team, away_team, match_time, tournament, tv_channel, status
+    FROM matches 
+    WHERE match_date = ?
+    ORDER BY match_time
+'''
+
+# {filter} - пусто или " AND news_type = ?"
+UNPUBLISHED_NEWS_QUERY = (
+    "SELECT * FROM news WHERE is_published = FALSE{filter} "
+    "ORDER BY importance DESC, published_date DESC LIMIT ?"
+)
+
+# IS вместо =: строки старых баз могут быть без сезона
+LEAGUE_STANDINGS_QUERY = '''
+    SELECT team_name, position, games_played, wins, draws, losses,
+           goals_for, goals_against, goal_difference, points
+    FROM league_table 
+    WHERE league = ?
+      AND season IS COALESCE(?, (SELECT MAX(season) FROM league_table WHERE league = ?))
+    ORDER BY position ASC
+'''
+
+CLEAN_API_CACHE_QUERY = "DELETE FROM api_cache WHERE expires_at < ?"
+
+USER_SUBSCRIPTIONS_QUERY = '''
+    SELECT team_name, player_name, subscription_type 
+    FROM user_subscriptions 
+    WHERE user_id = ? AND is_active = 1
+'''
+
+CLAIM_POSTS_QUERY = '''
+    SELECT id, idempotency_key, chat_id, message_type, payload, attempts
+    FROM outbox
+    WHERE status = 'pending' AND message_type = 'post' AND next_attempt_at <= ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+CLAIM_NOTIFICATIONS_QUERY = '''
+    SELECT id, idempotency_key, chat_id, message_type, payload, attempts
+    FROM outbox
+    WHERE status = 'pending' AND message_type != 'post' AND next_attempt_at <= ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Горячие запросы с примерами параметров; они не должны сканировать таблицы целиком
+HOT_QUERIES: List[Tuple[str, tuple]] = [
+    (TODAY_MATCHES_QUERY, ('2024-01-01',)),
+    (UNPUBLISHED_NEWS_QUERY.format(filter=""), (5,)),
+    (UNPUBLISHED_NEWS_QUERY.format(filter=" AND news_type = ?"), ('transfer', 5)),
+    (LEAGUE_STANDINGS_QUERY, ('Saudi Pro League', None, 'Saudi Pro League')),
+    (LEAGUE_STANDINGS_QUERY, ('Saudi Pro League', '2025/2026', 'Saudi Pro League')),
+    (CLEAN_API_CACHE_QUERY, ('2024-01-01',)),
+    (USER_SUBSCRIPTIONS_QUERY, (1,)),
+    (CLAIM_POSTS_QUERY, ('2024-01-01', 100)),
+    (CLAIM_NOTIFICATIONS_QUERY, ('2024-01-01', 100)),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0 для новой базы)"""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Применение всех недостающих миграций, возвращает количество примененных
+    
+    Каждая миграция выполняется в отдельной транзакции BEGIN IMMEDIATE, поэтому
+    несколько процессов, стартующих одновременно, не применят ее дважды.
+    Существующие базы без schema_version мигрируют на месте: базовые таблицы
+    создаются через IF NOT EXISTS и не затрагивают данные.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    applied = 0
+    for version, name, statements in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        applied += 1
+        logger.info(f"🛠️ Применена миграция {version}: {name}")
+    
+    return applied
+
+def find_table_scans(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """Горячие запросы, план которых все еще содержит полный скан таблицы"""
+    scans = []
+    for query, params in HOT_QUERIES:
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+            detail = row[-1]
+            # 'SCAN t USING INDEX' - обход индекса, а не таблицы
+            if detail.startswith('SCAN') and 'USING' not in detail:
+                scans.append((query, detail))
+    return scans
+
+# Проверка миграций и планов запросов
+if __name__ == "__main__":
+    print("🧪 Тестирование миграций схемы...")
+    
+    conn = sqlite3.connect(':memory:')
+    
+    print(f"✅ Применено миграций: {apply_migrations(conn)}")
+    print(f"✅ Повторный запуск: {apply_migrations(conn)} миграций")
+    print(f"📊 Версия схемы: {get_schema_version(conn)}")
+    
+    scans = find_table_scans(conn)
+    for query, detail in scans:
+        print(f"❌ {detail}: {' '.join(query.split())}")
+    if not scans:
+        print("✅ Горячие запросы используют индексы")
+    
+    conn.close()
+    if scans:
+        sys.exit(1)
+    print("🎉 Тестирование завершено!")
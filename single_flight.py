@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов (single-flight)
+    
+    Первый вызов с ключом запускает func в отдельной задаче, остальные
+    вызовы с тем же ключом, пришедшие до ее завершения, ждут ту же задачу
+    и получают тот же результат или то же исключение. Отмена одного из
+    ожидающих не отменяет общий запрос.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {'calls': 0, 'shared': 0}
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        """Результат func() для key, общий для всех одновременных вызовов"""
+        self._stats['calls'] += 1
+        
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._stats['shared'] += 1
+        
+        return await asyncio.shield(task)
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        """Удаление завершенного запроса: следующий вызов выполнится заново"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Исключение считается полученным, даже если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
+    
+    def is_running(self, key: Hashable) -> bool:
+        """Выполняется ли сейчас запрос с ключом key"""
+        return key in self._calls
+    
+    def in_flight(self) -> int:
+        return len(self._calls)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Количество вызовов и сколько из них получили чужой результат"""
+        return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,85 @@
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Модули, которые не должны загружаться при старте бота: они нужны только
+# в процессах отрисовки или при обращении к внешнему API
+HEAVY_MODULES = ('matplotlib', 'PIL', 'aiohttp', 'numpy')
+
+# Допустимое время импорта главного модуля бота (секунды)
+STARTUP_BUDGET_SECONDS = 1.5
+
+def _run_python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    """Запуск кода в новом интерпретаторе: кэш sys.modules не искажает замер"""
+    return subprocess.run([sys.executable, *flags, '-c', code],
+                          capture_output=True, text=True, check=True)
+
+def measure_import_time(module: str, runs: int = 5) -> float:
+    """Минимальное время холодного импорта модуля за несколько запусков (секунды)"""
+    code = (
+        "import time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    return min(float(_run_python(code).stdout.strip()) for _ in range(runs))
+
+def find_heavy_imports(module: str) -> List[str]:
+    """Тяжелые модули из HEAVY_MODULES, загруженные импортом module"""
+    code = (
+        "import sys\n"
+        f"import {module}\n"
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    output = _run_python(code).stdout.strip()
+    return output.split(',') if output else []
+
+def import_time_breakdown(module: str, top: int = 15) -> List[Tuple[str, float, float]]:
+    """Самые долгие импорты по данным -X importtime: (модуль, собственное, суммарное время в мс)"""
+    stderr = _run_python(f"import {module}", '-X', 'importtime').stderr
+    
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:top]
+
+def run_benchmark(module: str) -> Dict:
+    """Полный замер старта: время импорта, тяжелые модули и разбивка по импортам"""
+    return {
+        'module': module,
+        'import_seconds': measure_import_time(module),
+        'heavy_imports': find_heavy_imports(module),
+        'breakdown': import_time_breakdown(module)
+    }
+
+# Замер времени старта; ненулевой код выхода, если бюджет превышен
+if __name__ == "__main__":
+    print("🧪 Тестирование времени старта...")
+    
+    failed = False
+    for module in sys.argv[1:] or ['ultimate_match_tv_bot']:
+        try:
+            result = run_benchmark(module)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ {module}: импорт завершился ошибкой\n{e.stderr}")
+            failed = True
+            continue
+        
+        print(f"\n📦 {module}: {result['import_seconds'] * 1000:.0f} мс")
+        for name, self_ms, cumulative_ms in result['breakdown']:
+            print(f"   {cumulative_ms:8.1f} мс (собственное {self_ms:6.1f} мс)  {name}")
+        
+        if result['heavy_imports']:
+            print(f"❌ При старте загружены тяжелые модули: {', '.join(result['heavy_imports'])}")
+            failed = True
+        if result['import_seconds'] > STARTUP_BUDGET_SECONDS:
+            print(f"❌ Импорт дольше бюджета {STARTUP_BUDGET_SECONDS}с")
+            failed = True
+    
+    print("\n🎉 Тестирование завершено!" if not failed else "\n⚠️ Бюджет старта нарушен")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+class SubscriptionIndex:
+    """Обратный индекс подписок в памяти: (тип, название сущности) -> множество user_id
+    
+    Загружается один раз при старте и обновляется сквозной записью из
+    InteractiveHandler, поэтому рассылка уведомлений не обращается к БД.
+    """
+    
+    def __init__(self):
+        self._subscribers: Dict[Tuple[str, str], Set[int]] = {}
+        self._lock = threading.Lock()
+    
+    def load(self, conn: sqlite3.Connection) -> int:
+        """Полная загрузка активных подписок из БД, возвращает их количество"""
+        rows = conn.execute('''
+            SELECT user_id, team_name, player_name, subscription_type
+            FROM user_subscriptions
+            WHERE is_active = 1
+        ''').fetchall()
+        
+        subscribers: Dict[Tuple[str, str], Set[int]] = {}
+        for user_id, team_name, player_name, sub_type in rows:
+            name = team_name if sub_type == 'team' else player_name
+            subscribers.setdefault((sub_type, name), set()).add(user_id)
+        
+        with self._lock:
+            self._subscribers = subscribers
+        
+        return len(rows)
+    
+    def add(self, user_id: int, entity_name: str, entity_type: str):
+        """Добавление подписки в индекс"""
+        with self._lock:
+            self._subscribers.setdefault((entity_type, entity_name), set()).add(user_id)
+    
+    def remove(self, user_id: int, entity_name: str, entity_type: str):
+        """Удаление подписки из индекса"""
+        key = (entity_type, entity_name)
+        with self._lock:
+            users = self._subscribers.get(key)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._subscribers[key]
+    
+    def get_subscribers(self, entity_name: str, entity_type: str) -> List[int]:
+        """Подписчики одной сущности"""
+        with self._lock:
+            return list(self._subscribers.get((entity_type, entity_name), ()))
+    
+    def fan_out(self, entities: Iterable[Tuple[str, str]]) -> Dict[int, str]:
+        """Список рассылки: user_id -> первая упомянутая сущность, на которую он подписан
+        
+        Каждый пользователь попадает в результат один раз, порядок сущностей
+        определяет, о какой из них будет уведомление.
+        """
+        recipients: Dict[int, str] = {}
+        with self._lock:
+            for entity_name, entity_type in entities:
+                for user_id in self._subscribers.get((entity_type, entity_name), ()):
+                    if user_id not in recipients:
+                        recipients[user_id] = entity_name
+        return recipients
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(users) for users in self._subscribers.values())
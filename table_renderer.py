@@ -0,0 +1,300 @@
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+# Функции модуля выполняются в процессах RenderPool, поэтому принимают
+# только простые данные и возвращают готовые байты PNG.
+
+TABLE_HEADERS = ["#", "Команда", "И", "П", "Н", "Пр", "ЗГ", "ПГ", "О"]
+TABLE_TITLE = 'Saudi Pro League - Турнирная таблица'
+
+# Относительная ширина колонок (как colWidths в matplotlib)
+COLUMN_WEIGHTS = [0.08, 0.25, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08]
+
+HEADER_COLOR = '#1f4e79'
+TOP_ZONE_COLOR = '#e8f5e8'
+RELEGATION_ZONE_COLOR = '#ffe8e8'
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+
+# Параметры отрисовки по способам; входят в ключ кэша изображений
+RENDER_OPTIONS = {
+    'matplotlib': {'renderer': 'matplotlib', 'figsize': (12, 10), 'dpi': 300, 'fontsize': 10},
+    # Ширина под полноразмерный просмотр фото в Telegram без масштабирования
+    'pillow': {'renderer': 'pillow', 'width': 800, 'row_height': 34, 'title_height': 56,
+               'padding': 12, 'font_size': 16, 'title_font_size': 22},
+}
+
+# Шрифты с кириллицей: первый найденный загружается один раз на процесс
+FONT_CANDIDATES = {
+    False: ['DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 'arial.ttf'],
+    True: ['DejaVuSans-Bold.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 'arialbd.ttf'],
+}
+
+_fonts: Dict[Tuple[int, bool], object] = {}
+_base_canvases: Dict[Tuple, object] = {}
+_text_masks: Dict[Tuple[str, int, bool], Tuple] = {}
+_palette = None
+
+def init_worker(renderer: str = 'matplotlib'):
+    """Инициализация процесса отрисовки: тяжелые импорты и шрифты один раз на процесс"""
+    if renderer == 'pillow':
+        options = RENDER_OPTIONS['pillow']
+        _load_font(options['font_size'], False)
+        _load_font(options['font_size'], True)
+        _load_font(options['title_font_size'], True)
+    else:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot  # noqa: F401
+
+def render_matplotlib(teams_data: List[List[str]], options: Dict) -> bytes:
+    """Отрисовка турнирной таблицы средствами matplotlib"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
+    # Создаем изображение
+    fig, ax = plt.subplots(figsize=options['figsize'])
+    ax.axis('off')
+    
+    # Создаем таблицу
+    table = ax.table(cellText=teams_data, colLabels=TABLE_HEADERS,
+                   cellLoc='center', loc='center',
+                   colWidths=[0.08, 0.25, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08])
+    
+    # Стилизация таблицы
+    table.auto_set_font_size(False)
+    table.set_fontsize(options['fontsize'])
+    table.scale(1, 2)
+    
+    # Цвета для разных зон таблицы
+    for i in range(len(TABLE_HEADERS)):
+        table[(0, i)].set_facecolor('#1f4e79')  # Заголовок
+        table[(0, i)].set_text_props(weight='bold', color='white')
+    
+    # Зона Лиги Чемпионов (1-4 места)
+    for i in range(1, min(5, len(teams_data) + 1)):
+        for j in range(len(TABLE_HEADERS)):
+            table[(i, j)].set_facecolor('#e8f5e8')
+    
+    # Зона вылета (последние места)
+    for i in range(max(5, len(teams_data) - 1), len(teams_data) + 1):
+        for j in range(len(TABLE_HEADERS)):
+            table[(i, j)].set_facecolor('#ffe8e8')
+    
+    plt.title(TABLE_TITLE, fontsize=16, fontweight='bold', pad=20)
+    
+    # Сохраняем в PNG
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format='PNG', dpi=options['dpi'], bbox_inches='tight')
+    plt.close(fig)
+    
+    return img_buffer.getvalue()
+
+def _load_font(size: int, bold: bool):
+    """Шрифт из кэша процесса, при первом обращении - загрузка с диска"""
+    font = _fonts.get((size, bold))
+    if font is None:
+        from PIL import ImageFont
+        for candidate in FONT_CANDIDATES[bold]:
+            try:
+                font = ImageFont.truetype(candidate, size)
+                break
+            except OSError:
+                continue
+        else:
+            font = ImageFont.load_default()
+        _fonts[(size, bold)] = font
+    return font
+
+def _column_bounds(options: Dict) -> List[Tuple[int, int]]:
+    """Границы колонок по горизонтали"""
+    inner = options['width'] - 2 * options['padding']
+    total = sum(COLUMN_WEIGHTS)
+    bounds = []
+    x = options['padding']
+    for weight in COLUMN_WEIGHTS:
+        width = round(inner * weight / total)
+        bounds.append((x, x + width))
+        x += width
+    return bounds
+
+def _text_mask(text: str, size: int, bold: bool) -> Tuple:
+    """Маска текста из кэша процесса: (маска, смещение x, смещение y)
+    
+    Значения в таблице сильно повторяются (очки, номера, названия команд),
+    поэтому каждая строка растеризуется один раз, а дальше только
+    накладывается на изображение.
+    """
+    key = (text, size, bold)
+    cached = _text_masks.get(key)
+    if cached is None:
+        from PIL import Image, ImageDraw
+        font = _load_font(size, bold)
+        left, top, right, bottom = font.getbbox(text)
+        mask = Image.new('L', (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+        cached = _text_masks[key] = (mask, left, top)
+    return cached
+
+def _draw_text(image, box: Tuple[int, int, int, int], text: str, size: int, bold: bool,
+               fill: Tuple[int, int, int], align: str = 'center'):
+    """Текст внутри прямоугольника: общая базовая линия для всех строк одного шрифта"""
+    mask, left, top = _text_mask(text, size, bold)
+    ascent, descent = _load_font(size, bold).getmetrics()
+    x0, y0, x1, y1 = box
+    y = y0 + (y1 - y0 - ascent - descent) // 2 + top
+    if align == 'left':
+        x = x0 + 10 + left
+    else:
+        x = x0 + (x1 - x0 - mask.width) // 2
+    image.paste(fill, (x, y), mask)
+
+def _base_canvas(row_count: int, options: Dict):
+    """Заготовка таблицы без данных: фон, заголовок, шапка, цвета зон и сетка
+    
+    Заготовка зависит только от числа строк и параметров, поэтому строится
+    один раз, а при отрисовке копируется.
+    """
+    key = (row_count, tuple(sorted(options.items())))
+    canvas = _base_canvases.get(key)
+    if canvas is not None:
+        return canvas
+    
+    from PIL import Image, ImageDraw
+    
+    width, row_height, padding = options['width'], options['row_height'], options['padding']
+    table_top = options['title_height']
+    height = table_top + (row_count + 1) * row_height + padding
+    
+    canvas = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(canvas)
+    columns = _column_bounds(options)
+    left, right = columns[0][0], columns[-1][1]
+    
+    _draw_text(canvas, (0, 0, width, table_top), TABLE_TITLE, options['title_font_size'], True, BLACK)
+    
+    # Шапка
+    draw.rectangle((left, table_top, right, table_top + row_height), fill=HEADER_COLOR)
+    for (x0, x1), header in zip(columns, TABLE_HEADERS):
+        _draw_text(canvas, (x0, table_top, x1, table_top + row_height), header,
+                   options['font_size'], True, WHITE)
+    
+    # Зона Лиги Чемпионов (1-4 места) и зона вылета (последние места)
+    for i in range(1, row_count + 1):
+        if i < 5:
+            fill = TOP_ZONE_COLOR
+        elif i >= max(5, row_count - 1):
+            fill = RELEGATION_ZONE_COLOR
+        else:
+            continue
+        y0 = table_top + i * row_height
+        draw.rectangle((left, y0, right, y0 + row_height), fill=fill)
+    
+    # Сетка
+    bottom = table_top + (row_count + 1) * row_height
+    for i in range(row_count + 2):
+        y = table_top + i * row_height
+        draw.line((left, y, right, y), fill='black')
+    for x0, _ in columns:
+        draw.line((x0, table_top, x0, bottom), fill='black')
+    draw.line((right, table_top, right, bottom), fill='black')
+    
+    _base_canvases[key] = canvas
+    return canvas
+
+def _output_palette():
+    """Фиксированная палитра PNG: цвета фона, текста и их сглаженные смешения
+    
+    Изображение состоит из нескольких известных цветов, поэтому сохранение в
+    палитровом PNG не теряет качества, а кодируется в несколько раз быстрее RGB.
+    """
+    global _palette
+    if _palette is None:
+        from PIL import Image, ImageColor
+        
+        def blend(background, foreground, alpha):
+            return tuple(round(b + (f - b) * alpha) for b, f in zip(background, foreground))
+        
+        backgrounds = [ImageColor.getrgb(color)
+                       for color in ('white', TOP_ZONE_COLOR, RELEGATION_ZONE_COLOR, HEADER_COLOR)]
+        colors = []
+        for background in backgrounds:
+            for foreground in (BLACK, WHITE):
+                for level in range(16):
+                    color = blend(background, foreground, level / 15)
+                    if color not in colors:
+                        colors.append(color)
+        
+        _palette = Image.new('P', (1, 1))
+        _palette.putpalette([channel for color in colors[:256] for channel in color])
+    return _palette
+
+def render_pillow(teams_data: List[List[str]], options: Dict) -> bytes:
+    """Отрисовка турнирной таблицы средствами Pillow
+    
+    На заготовку из _base_canvas наносится только текст ячеек, поэтому
+    отрисовка занимает миллисекунды и не требует matplotlib.
+    """
+    from PIL import Image
+    
+    image = _base_canvas(len(teams_data), options).copy()
+    columns = _column_bounds(options)
+    row_height = options['row_height']
+    
+    for i, row in enumerate(teams_data, start=1):
+        y0 = options['title_height'] + i * row_height
+        for j, ((x0, x1), value) in enumerate(zip(columns, row)):
+            _draw_text(image, (x0, y0, x1, y0 + row_height), str(value), options['font_size'], False,
+                       BLACK, align='left' if j == 1 else 'center')
+    
+    # Палитровый PNG с быстрым сжатием: кодирование RGB заняло бы большую часть времени
+    img_buffer = BytesIO()
+    image = image.quantize(palette=_output_palette(), dither=Image.Dither.NONE)
+    image.save(img_buffer, format='PNG', compress_level=1)
+    return img_buffer.getvalue()
+
+RENDERERS = {
+    'matplotlib': render_matplotlib,
+    'pillow': render_pillow,
+}
+
+def render_league_table(teams_data: List[List[str]], options: Dict) -> bytes:
+    """Отрисовка таблицы выбранным в options['renderer'] способом"""
+    return RENDERERS[options['renderer']](teams_data, options)
+
+def benchmark(teams_data: List[List[str]], renderer: str, iterations: int = 20) -> Dict:
+    """Среднее время отрисовки (мс) и размер PNG для способа отрисовки"""
+    options = RENDER_OPTIONS[renderer]
+    
+    started = time.perf_counter()
+    image = render_league_table(teams_data, options)
+    first_ms = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render_league_table(teams_data, options)
+    avg_ms = (time.perf_counter() - started) * 1000 / iterations
+    
+    return {'renderer': renderer, 'first_ms': first_ms, 'avg_ms': avg_ms, 'size_kb': len(image) / 1024}
+
+# Сравнение способов отрисовки
+if __name__ == "__main__":
+    print("🧪 Тестирование отрисовки турнирной таблицы...")
+    
+    sample = [
+        [str(position), f"Команда {position}", "25", "12", "6", "7", "40", "30", str(42 - position)]
+        for position in range(1, 19)
+    ]
+    
+    for name in ('pillow', 'matplotlib'):
+        try:
+            result = benchmark(sample, name, iterations=50 if name == 'pillow' else 3)
+        except ImportError as e:
+            print(f"⚠️ {name}: недоступен ({e})")
+            continue
+        print(f"📊 {name}: первая отрисовка {result['first_ms']:.1f} мс, "
+              f"в среднем {result['avg_ms']:.1f} мс, PNG {result['size_kb']:.0f} КБ")
+    
+    print("🎉 Тестирование завершено!")
@@ -5,13 +5,9 @@ import random
 import json
 import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-import aiohttp
-from PIL import Image, ImageDraw, ImageFont
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+from typing import Dict, List, Optional, Any, Awaitable, Callable
 from io import BytesIO
-import base64
+import hashlib
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import (
@@ -22,12 +18,37 @@ from telegram.ext import (
     filters,
     ContextTypes
  )
+from telegram.error import BadRequest
 
 # Импортируем наши модули
 from advanced_content_generator import AdvancedContentGenerator
 from interactive_handler import InteractiveHandler
 from database_manager import DatabaseManager
-from error_handler import ErrorHandler
+from async_database import AsyncDatabaseManager
+from error_handler import ErrorHandler, HealthChecker
+from broadcast import BroadcastEngine
+from outbox import OutboxWorker
+from render_cache import RenderCache
+from job_runner import JobRunner
+from loop_monitor import LoopLagMonitor
+from match_day_scheduler import MatchDayScheduler
+from render_pool import RenderPool
+from ingestion import FootballAPIClient, IngestionPipeline
+from metrics import LATENCY_METRICS, REGISTRY
+from metrics_server import MetricsServer
+from table_renderer import RENDER_OPTIONS, init_worker, render_league_table
+
+# Таблица по умолчанию, пока в БД нет актуальных данных
+DEFAULT_TABLE_ROWS = [
+    ["1", "Аль-Хиляль", "25", "20", "5", "0", "68", "15", "65"],
+    ["2", "Аль-Насср", "25", "18", "6", "1", "62", "20", "60"],
+    ["3", "Аль-Ахли", "25", "16", "7", "2", "55", "25", "55"],
+    ["4", "Аль-Иттихад", "25", "15", "5", "5", "50", "30", "50"],
+    ["5", "Аль-Шабаб", "25", "12", "8", "5", "42", "35", "44"],
+    ["6", "Аль-Фатех", "25", "11", "6", "8", "38", "40", "39"],
+    ["7", "Аль-Таавун", "25", "10", "7", "8", "35", "38", "37"],
+    ["8", "Аль-Вехда", "25", "9", "8", "8", "32", "35", "35"]
+]
 
 class UltimateMatchTVBot:
     """
@@ -43,12 +64,16 @@ class UltimateMatchTVBot:
     - Трансферные новости и слухи
     """
     
-    def __init__(self):
+    def __init__(self, table_renderer: str = 'pillow'):
         # Конфигурация
         self.bot_token = "7541467929:AAGLOxsVGckECmbRJX9xIxiaFXuzDcOHbNQ"
         self.channel_id = "-1002643651612"
         self.db_path = 'ultimate_match_tv_bot.db'
         
+        # Способ отрисовки таблицы: 'pillow' (быстрый) или 'matplotlib'
+        self.table_renderer = table_renderer
+        self.table_render_options = RENDER_OPTIONS[table_renderer]
+        
         # Настройка логирования
         logging.basicConfig(
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -58,23 +83,71 @@ class UltimateMatchTVBot:
 
         # Инициализация компонентов
         self.content_generator = AdvancedContentGenerator(self.db_path)
-        self.interactive_handler = InteractiveHandler(self.db_path)
         self.db_manager = DatabaseManager(self.db_path)
+        self.db_manager.recover_outbox()
+        self.async_db = AsyncDatabaseManager(self.db_manager)
+        self.interactive_handler = InteractiveHandler(self.db_path, async_db=self.async_db)
         self.error_handler = ErrorHandler(self.logger)
         
-        # Создание приложения
-        self.app = Application.builder().token(self.bot_token).build()
+        # Кэш изображений турнирной таблицы, сбрасывается при изменении league_table
+        self.render_cache = RenderCache('render_cache')
+        
+        # Отрисовка в отдельных процессах: цикл событий не блокируется
+        self.render_pool = RenderPool(max_workers=2, max_pending=8, timeout=30.0,
+                                      initializer=init_worker, initargs=(self.table_renderer,))
+        self.db_manager.add_standings_listener(self._on_standings_changed)
+        
+        # Периодические задачи: без наложения запусков, с таймаутами и учетом результатов
+        self.job_runner = JobRunner(store=self.async_db)
+        
+        # Частота публикаций по расписанию матчей
+        self.match_scheduler = MatchDayScheduler(self.async_db)
+        
+        # Загрузка данных из API-Football через одну общую HTTP-сессию
+        self.api_client = FootballAPIClient(self.async_db, api_key=os.getenv('API_FOOTBALL_KEY'),
+                                            error_handler=self.error_handler)
+        self.ingestion = IngestionPipeline(self.api_client, self.async_db)
+        
+        # Создание приложения: задачи настраиваются при старте и отменяются при остановке
+        self.app = (
+            Application.builder()
+            .token(self.bot_token)
+            .post_init(self._on_startup)
+            .post_stop(self._on_stop)
+            .build()
+        )
+        
+        # Статистика работы: счетчики и гистограммы задержек в общем реестре метрик
+        self.start_time = datetime.now()
+        self.metrics = REGISTRY
+        self.counters = {
+            'posts_sent': REGISTRY.counter('bot_posts_sent_total', 'Опубликованные посты'),
+            'users_interacted': REGISTRY.counter('bot_users_interacted_total', 'Обработанные обновления пользователей'),
+            'errors_handled': REGISTRY.counter('bot_errors_handled_total', 'Обработанные ошибки')
+        }
+        self.render_seconds = REGISTRY.histogram('bot_render_seconds', 'Время отрисовки таблицы',
+                                                 renderer=self.table_renderer)
         
         # Регистрация обработчиков
         self._register_handlers()
         
-        # Статистика работы
-        self.stats = {
-            'posts_sent': 0,
-            'users_interacted': 0,
-            'errors_handled': 0,
-            'start_time': datetime.now()
-        }
+        # Рассылка персональных уведомлений с учетом лимитов Telegram
+        self.broadcaster = BroadcastEngine(self.app.bot)
+        
+        # Постоянная очередь постов и уведомлений поверх рассылки
+        self.outbox = OutboxWorker(self.async_db, self.broadcaster)
+        
+        # Мониторинг: задержка цикла событий, /metrics в формате Prometheus и /healthz
+        self.loop_monitor = LoopLagMonitor(interval=0.5, threshold=1.0)
+        self.health_checker = HealthChecker(self.logger, loop_monitor=self.loop_monitor)
+        self.metrics_server = MetricsServer(
+            health_checker=self.health_checker,
+            host=os.getenv('METRICS_HOST', '0.0.0.0'),
+            port=int(os.getenv('METRICS_PORT', '9090')),
+            collectors=[self._collect_metrics],
+            probes=[self._check_database]
+        )
+        self._register_gauges()
         
         self.logger.info("🚀 Ultimate Saudi Football TV Bot инициализирован")
 
@@ -107,21 +180,62 @@ class UltimateMatchTVBot:
         self.app.add_handler(CallbackQueryHandler(self.handle_top_scorers, pattern="^top_scorers$"))
         self.app.add_handler(CallbackQueryHandler(self.handle_fixtures, pattern="^fixtures$"))
         
+        # Время каждого обработчика записывается в гистограмму задержек
+        for handlers in self.app.handlers.values():
+            for handler in handlers:
+                handler.callback = self._timed_handler(handler.callback)
+        
         # Обработчик ошибок
         self.app.add_error_handler(self.error_handler.handle_telegram_error)
+    
+    def _timed_handler(self, callback: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        """Обертка обработчика, записывающая его время и число обращений пользователей"""
+        latency = self.metrics.histogram('bot_handler_latency_seconds', 'Время обработки обновлений',
+                                         handler=callback.__name__)
+        interactions = self.counters['users_interacted']
+        
+        async def timed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            interactions.inc()
+            with latency.time():
+                return await callback(update, context)
+        return timed
+    
     async def handle_bot_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды статистики бота"""
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = datetime.now() - self.start_time
+        
+        jobs_text = "\n".join(
+            f"• {name}: {record['last_status']}, {record['last_duration']:.1f}с "
+            f"(запусков {record['runs']}, ошибок {record['errors'] + record['timeouts']}, пропусков {record['skipped']})"
+            for name, record in self.job_runner.get_stats().items()
+        ) or "• еще не запускались"
+        
+        cache = self.api_client.get_stats()
+        
+        latency_text = "\n".join(
+            f"• {title}: {summary['p50'] * 1000:.0f} / {summary['p99'] * 1000:.0f} мс ({summary['count']})"
+            for title, summary in ((title, self.metrics.summary(name)) for title, name in LATENCY_METRICS)
+        )
         
         stats_text = f"""📊 СТАТИСТИКА БОТА
 
 🚀 Время работы: {uptime.days} дней, {uptime.seconds // 3600} часов
-📰 Постов отправлено: {self.stats['posts_sent']}
-👥 Пользователей взаимодействовало: {self.stats['users_interacted']}
-⚠️ Ошибок обработано: {self.stats['errors_handled']}
+📰 Постов отправлено: {self.metrics.value('bot_posts_sent_total'):.0f}
+👥 Обращений пользователей: {self.metrics.value('bot_users_interacted_total'):.0f}
+⚠️ Ошибок обработано: {self.metrics.value('bot_errors_handled_total'):.0f}
+🔔 Уведомлений отправлено: {self.metrics.value('bot_notifications_sent_total'):.0f} (ошибок: {self.metrics.value('bot_notifications_failed_total'):.0f})
+📨 Скорость последней рассылки: {self.metrics.value('bot_broadcast_throughput'):.1f} сообщ./с
+
+⏳ ЗАДЕРЖКИ (p50 / p99):
+{latency_text}
+
+⏱️ ЗАДАЧИ:
+{jobs_text}
+
+🗄️ Кэш API: попаданий {cache['hits']} (из БД {cache['disk_hits']}), промахов {cache['misses']} (еще {cache['coalesced']} дождались общего запроса), устаревших {cache['stale']}, записей {cache['entries']} ({cache['bytes'] // 1024} КБ)
 
 🔥 Статус: Работает в полном режиме
-📡 Частота публикаций: каждые 15-30 минут
+📡 Частота публикаций: {self.match_scheduler.describe()}
 🎯 Режим: Saudi Football TV (Матч ТВ стиль)
 
 #BotStats #SaudiFootballTV"""
@@ -175,9 +289,6 @@ class UltimateMatchTVBot:
     async def handle_current_table(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка запроса турнирной таблицы"""
         try:
-            # Генерируем изображение турнирной таблицы
-            table_image = await self.generate_league_table_image()
-            
             table_text = """🏆 ТУРНИРНАЯ ТАБЛИЦА Saudi Pro League
 
 Актуальная таблица чемпионата на сегодня:"""
@@ -185,12 +296,15 @@ class UltimateMatchTVBot:
             keyboard = [[InlineKeyboardButton("🔙 К статистике", callback_data="statistics_menu")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            if table_image:
-                await update.callback_query.edit_message_media(
-                    media=InputMediaPhoto(media=table_image, caption=table_text),
+            # Изображение таблицы: по file_id, если оно уже загружалось
+            sent = await self.send_league_table_photo(
+                lambda photo: update.callback_query.edit_message_media(
+                    media=InputMediaPhoto(media=photo, caption=table_text),
                     reply_markup=reply_markup
                 )
-            else:
+            )
+            
+            if not sent:
                 # Если изображение не удалось создать, отправляем текстовую версию
                 table_text += self._generate_text_table()
                 await update.callback_query.edit_message_text(table_text, reply_markup=reply_markup)
@@ -256,65 +370,95 @@ class UltimateMatchTVBot:
         await update.callback_query.edit_message_text(fixtures_text, reply_markup=reply_markup)
 
     async def generate_league_table_image(self) -> Optional[BytesIO]:
-        """Генерация изображения турнирной таблицы"""
+        """Изображение турнирной таблицы из кэша или новая отрисовка"""
         try:
-            # Создаем изображение
-            fig, ax = plt.subplots(figsize=(12, 10))
-            ax.axis('off')
-            
-            # Данные таблицы
-            teams_data = [
-                ["1", "Аль-Хиляль", "25", "20", "5", "0", "68", "15", "65"],
-                ["2", "Аль-Насср", "25", "18", "6", "1", "62", "20", "60"],
-                ["3", "Аль-Ахли", "25", "16", "7", "2", "55", "25", "55"],
-                ["4", "Аль-Иттихад", "25", "15", "5", "5", "50", "30", "50"],
-                ["5", "Аль-Шабаб", "25", "12", "8", "5", "42", "35", "44"],
-                ["6", "Аль-Фатех", "25", "11", "6", "8", "38", "40", "39"],
-                ["7", "Аль-Таавун", "25", "10", "7", "8", "35", "38", "37"],
-                ["8", "Аль-Вехда", "25", "9", "8", "8", "32", "35", "35"]
-            ]
-            
-            headers = ["#", "Команда", "И", "П", "Н", "Пр", "ЗГ", "ПГ", "О"]
-            
-            # Создаем таблицу
-            table = ax.table(cellText=teams_data, colLabels=headers, 
-                           cellLoc='center', loc='center',
-                           colWidths=[0.08, 0.25, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08])
-            
-            # Стилизация таблицы
-            table.auto_set_font_size(False)
-            table.set_fontsize(10)
-            table.scale(1, 2)
-            
-            # Цвета для разных зон таблицы
-            for i in range(len(headers)):
-                table[(0, i)].set_facecolor('#1f4e79')  # Заголовок
-                table[(0, i)].set_text_props(weight='bold', color='white')
-            
-            # Зона Лиги Чемпионов (1-4 места)
-            for i in range(1, 5):
-                for j in range(len(headers)):
-                    table[(i, j)].set_facecolor('#e8f5e8')
-            
-            # Зона вылета (последние места)
-            for i in range(7, 9):
-                for j in range(len(headers)):
-                    table[(i, j)].set_facecolor('#ffe8e8')
-            
-            plt.title('Saudi Pro League - Турнирная таблица', 
-                     fontsize=16, fontweight='bold', pad=20)
-            
-            # Сохраняем в BytesIO
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='PNG', dpi=300, bbox_inches='tight')
-            img_buffer.seek(0)
-            plt.close()
-            
-            return img_buffer
+            teams_data = await self._league_table_rows()
+            return BytesIO(await self._get_league_table_image(teams_data))
             
         except Exception as e:
             self.logger.error(f"Ошибка генерации изображения таблицы: {e}")
             return None
+    
+    async def _get_league_table_image(self, teams_data: List[List[str]]) -> bytes:
+        """PNG таблицы из RenderCache, при промахе - отрисовка в пуле процессов и сохранение"""
+        key = RenderCache.make_key(teams_data, self.table_render_options)
+        
+        image = self.render_cache.get(key)
+        if image is None:
+            with self.render_seconds.time():
+                image = await self.render_pool.submit(render_league_table, teams_data, self.table_render_options)
+            self.render_cache.put(key, image)
+        
+        return image
+    
+    async def send_league_table_photo(self, send: Callable[[Any], Awaitable]) -> bool:
+        """Отправка изображения таблицы через send(photo)
+        
+        Если это изображение уже загружалось, send получает сохраненный file_id
+        и файл повторно не передается. После загрузки новых байтов file_id из
+        ответа Telegram запоминается по хэшу изображения. Возвращает False,
+        если изображение не удалось получить.
+        """
+        try:
+            teams_data = await self._league_table_rows()
+            image_hash = RenderCache.make_key(teams_data, self.table_render_options)
+        except Exception as e:
+            self.logger.error(f"Ошибка генерации изображения таблицы: {e}")
+            return False
+        
+        file_id = await self.async_db.get_image_file_id(image_hash)
+        if file_id:
+            try:
+                await send(file_id)
+                return True
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    return True
+                # file_id больше не действителен - загружаем файл заново
+                self.logger.warning(f"⚠️ file_id изображения отклонен Telegram: {e}")
+                await self.async_db.delete_image_file_id(image_hash)
+        
+        try:
+            image = await self._get_league_table_image(teams_data)
+        except Exception as e:
+            self.logger.error(f"Ошибка генерации изображения таблицы: {e}")
+            return False
+        
+        message = await send(BytesIO(image))
+        
+        # edit_message_media для inline-сообщений возвращает True вместо Message
+        photo = getattr(message, 'photo', None)
+        if photo:
+            await self.async_db.save_image_file_id(image_hash, photo[-1].file_id)
+        
+        return True
+    
+    async def _league_table_rows(self) -> List[List[str]]:
+        """Строки таблицы для отрисовки: данные из БД или таблица по умолчанию"""
+        standings = await self.async_db.get_league_standings()
+        if not standings:
+            return DEFAULT_TABLE_ROWS
+        
+        return [[str(row[field]) for field in ('position', 'name', 'games', 'wins', 'draws',
+                                               'losses', 'goals_for', 'goals_against', 'points')]
+                for row in standings]
+    
+    def _on_standings_changed(self, league: str):
+        """Фоновая отрисовка новой таблицы после ее изменения
+        
+        Кэш изображений не сбрасывается: ключ строится по содержимому таблицы,
+        поэтому старые изображения просто перестают запрашиваться.
+        """
+        self.app.job_queue.run_once(
+            self.job_runner.job('league_table_prewarm', self.warm_league_table_image, timeout=60),
+            when=0,
+            name="league_table_prewarm"
+        )
+    
+    async def warm_league_table_image(self):
+        """Предварительная отрисовка таблицы, чтобы первый запрос получил готовое изображение"""
+        if await self.generate_league_table_image():
+            self.logger.info("🖼️ Изображение турнирной таблицы подготовлено")
 
     def _generate_text_table(self) -> str:
         """
@@ -357,14 +501,13 @@ class UltimateMatchTVBot:
             message += f"\n\n📅 {datetime.now().strftime('%d.%m.%Y %H:%M')}"
             message += "\n\n#UrgentNews #SaudiProLeague #Breaking"
             
-            await self.app.bot.send_message(chat_id=self.channel_id, text=message)
+            await self.publish_post(message, 'urgent_news')
             
-            self.stats['posts_sent'] += 1
-            self.logger.info("✅ Срочная новость отправлена")
+            self.logger.info("✅ Срочная новость поставлена в очередь")
             
         except Exception as e:
             self.logger.error(f"Ошибка отправки срочной новости: {e}")
-            self.stats['errors_handled'] += 1
+            self.counters['errors_handled'].inc()
 
     async def send_full_news(self):
         """Отправка полных новостей (каждые 30 минут)"""
@@ -411,67 +554,80 @@ class UltimateMatchTVBot:
             else:  # transfer_news
                 message = self.content_generator.generate_transfer_news()
             
-            # Отправляем сообщение
-            await self.app.bot.send_message(chat_id=self.channel_id, text=message)
-            
             # Сохраняем в базу данных
-            self.db_manager.save_post(message, content_type)
+            await self.async_db.save_post(message, content_type)
             
-            self.stats['posts_sent'] += 1
-            self.logger.info(f"✅ Полная новость отправлена: {content_type}")
+            # Пост и персональные уведомления подписчикам ставятся в очередь вместе
+            await self.publish_post(message, content_type, notify=True)
             
-            # Отправляем персональные уведомления подписчикам
-            await self.send_personalized_notifications(message, content_type)
+            self.logger.info(f"✅ Полная новость поставлена в очередь: {content_type}")
             
         except Exception as e:
             self.logger.error(f"Ошибка отправки полной новости: {e}")
-            self.stats['errors_handled'] += 1
+            self.counters['errors_handled'].inc()
 
-    async def send_personalized_notifications(self, message: str, content_type: str):
-        """Отправка персональных уведомлений подписчикам"""
-        try:
-            # Извлекаем упоминания команд и игроков из сообщения
-            mentioned_teams = []
-            mentioned_players = []
-            
-            for team in self.content_generator.saudi_teams.keys():
-                if team in message:
-                    mentioned_teams.append(team)
-            
-            for player in self.content_generator.player_database.keys():
-                if player in message:
-                    mentioned_players.append(player)
-            
-            # Получаем подписчиков и отправляем уведомления
-            notified_users = set()
+    async def publish_post(self, message: str, post_type: str, idempotency_key: str = None,
+                           notify: bool = False) -> int:
+        """Публикация поста в канале через outbox
             
-            for team in mentioned_teams:
-                subscribers = self.interactive_handler.get_subscribed_users(team, 'team')
-                for user_id in subscribers:
-                    if user_id not in notified_users:
-                        try:
-                            notification = f"🔔 Новость о {team}:\n\n{message[:500]}..."
-                            await self.app.bot.send_message(chat_id=user_id, text=notification)
-                            notified_users.add(user_id)
-                        except Exception as e:
-                            self.logger.warning(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
-            
-            for player in mentioned_players:
-                subscribers = self.interactive_handler.get_subscribed_users(player, 'player')
-                for user_id in subscribers:
-                    if user_id not in notified_users:
-                        try:
-                            notification = f"🔔 Новость о {player}:\n\n{message[:500]}..."
-                            await self.app.bot.send_message(chat_id=user_id, text=notification)
-                            notified_users.add(user_id)
-                        except Exception as e:
-                            self.logger.warning(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
-            
-            if notified_users:
-                self.logger.info(f"✅ Персональные уведомления отправлены {len(notified_users)} пользователям")
+        Пост (и при notify=True уведомления подписчикам) записывается в очередь
+        одной транзакцией, поэтому после сбоя он не будет отправлен дважды.
+        По умолчанию ключ идемпотентности строится из текста поста. Отправка
+        идет в задаче outbox_drain, которая запускается сразу, а если она уже
+        работает, захватит пост следующей порцией раньше уведомлений.
+        """
+        post_key = idempotency_key or f"{post_type}:{hashlib.sha1(message.encode('utf-8')).hexdigest()}"
+            
+        messages = [{
+            'idempotency_key': post_key,
+            'chat_id': self.channel_id,
+            'text': message,
+            'message_type': 'post'
+        }]
+        if notify:
+            messages.extend(self._build_notifications(message, post_key))
+            
+        queued = await self.outbox.enqueue(messages)
+        if not self.job_runner.is_running('outbox_drain'):
+            self.app.job_queue.run_once(
+                self.job_runner.job('outbox_drain', self.drain_outbox, timeout=900),
+                when=0,
+                name="outbox_drain_now"
+            )
+        return queued
+            
+    async def drain_outbox(self) -> Dict:
+        """Выгрузка outbox с учетом опубликованных постов"""
+        totals = await self.outbox.drain()
+            
+        posts_sent = totals['sent_by_type'].get('post', 0)
+        self.counters['posts_sent'].inc(posts_sent)
+        if posts_sent:
+            self.health_checker.update_message_status(True)
+            
+        notifications_sent = totals['sent_by_type'].get('notification', 0)
+        if notifications_sent:
+            self.logger.info(
+                f"✅ Персональные уведомления отправлены {notifications_sent} пользователям "
+                f"({self.metrics.value('bot_broadcast_throughput'):.1f} сообщ./с, ошибок: {totals['failed']})"
+            )
+        return totals
                 
-        except Exception as e:
-            self.logger.error(f"Ошибка отправки персональных уведомлений: {e}")
+    def _build_notifications(self, message: str, post_key: str) -> List[Dict]:
+        """Уведомления подписчикам о сущностях, упомянутых в посте"""
+        # Извлекаем упоминания команд и игроков из сообщения за один проход
+        mentions = self.content_generator.find_mentioned_entities(message)
+        
+        # Список рассылки из индекса подписок: каждый пользователь один раз,
+        # с первой упомянутой сущностью, на которую он подписан
+        recipients = self.interactive_handler.subscription_index.fan_out(mentions)
+        
+        return [{
+            'idempotency_key': f"notify:{post_key}:{user_id}",
+            'chat_id': user_id,
+            'text': f"🔔 Новость о {entity_name}:\n\n{message[:500]}...",
+            'message_type': 'notification'
+        } for user_id, entity_name in recipients.items()]
 
     async def send_daily_schedule(self):
         """Отправка ежедневного расписания матчей (каждый день в 9:00)"""
@@ -499,21 +655,21 @@ class UltimateMatchTVBot:
 
 #Schedule #SaudiProLeague #MatchDay"""
 
-            await self.app.bot.send_message(chat_id=self.channel_id, text=schedule_message)
+            # Одно расписание в день даже при повторном запуске задачи
+            await self.publish_post(
+                schedule_message, 'daily_schedule',
+                idempotency_key=f"daily_schedule:{datetime.now().strftime('%Y-%m-%d')}"
+            )
             
-            self.stats['posts_sent'] += 1
-            self.logger.info("✅ Ежедневное расписание отправлено")
+            self.logger.info("✅ Ежедневное расписание поставлено в очередь")
             
         except Exception as e:
             self.logger.error(f"Ошибка отправки расписания: {e}")
-            self.stats['errors_handled'] += 1
+            self.counters['errors_handled'].inc()
 
     async def send_weekly_table(self):
         """Отправка еженедельной турнирной таблицы (каждый понедельник в 10:00)"""
         try:
-            # Генерируем изображение таблицы
-            table_image = await self.generate_league_table_image()
-            
             table_message = """🏆 ТУРНИРНАЯ ТАБЛИЦА Saudi Pro League
 
 📊 Актуальная таблица после завершения тура:
@@ -534,58 +690,166 @@ class UltimateMatchTVBot:
 
 #Table #SaudiProLeague #Standings"""
 
-            if table_image:
-                await self.app.bot.send_photo(
+            # Изображение таблицы: по file_id, если оно уже загружалось
+            sent = await self.send_league_table_photo(
+                lambda photo: self.app.bot.send_photo(
                     chat_id=self.channel_id,
-                    photo=table_image,
+                    photo=photo,
                     caption=table_message
                 )
-            else:
+            )
+            
+            if not sent:
                 # Если изображение не удалось создать, отправляем текстовую версию
                 table_message += self._generate_text_table()
                 await self.app.bot.send_message(chat_id=self.channel_id, text=table_message)
             
-            self.stats['posts_sent'] += 1
+            self.counters['posts_sent'].inc()
             self.logger.info("✅ Еженедельная таблица отправлена")
             
         except Exception as e:
             self.logger.error(f"Ошибка отправки таблицы: {e}")
-            self.stats['errors_handled'] += 1
+            self.counters['errors_handled'].inc()
+    
+    async def _on_startup(self, application: Application):
+        """Запуск приложения: настройка запланированных задач и сервера метрик"""
+        await self.setup_scheduled_jobs()
+        await self.loop_monitor.start()
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            # Занятый порт не должен мешать работе бота
+            self.logger.error(f"❌ Сервер метрик не запущен: {e}")
+    
+    async def _on_stop(self, application: Application):
+        """Остановка приложения: отмена задач, которые еще выполняются"""
+        await self.job_runner.shutdown()
+        await self.metrics_server.stop()
+        await self.loop_monitor.stop()
+        await self.api_client.close()
+        await self.render_pool.cancel_retiring()
+    
+    def _register_gauges(self):
+        """Метрики, которые вычисляются при чтении: глубина очередей и размер кэша"""
+        self.metrics.gauge('bot_render_pending', 'Задачи отрисовки в очереди и в работе').set_function(
+            lambda: self.render_pool.pending)
+        self.metrics.gauge('bot_jobs_running', 'Выполняющиеся периодические задачи').set_function(
+            self.job_runner.running_count)
+        self.metrics.gauge('bot_api_cache_entries', 'Записи кэша API в памяти').set_function(
+            lambda: self.api_client.get_stats()['entries'])
+        self.metrics.gauge('bot_api_cache_bytes', 'Размер кэша API в памяти').set_function(
+            lambda: self.api_client.get_stats()['bytes'])
+    
+    async def _collect_metrics(self):
+        """Метрики, требующие запроса к БД, и состояние выключателей API; вызывается при каждом опросе"""
+        outbox = await self.async_db.get_outbox_stats()
+        for status in ('pending', 'claimed', 'sending', 'sent', 'failed', 'unknown'):
+            self.metrics.gauge('bot_outbox_messages', 'Сообщения outbox по статусам',
+                               status=status).set(outbox.get(status, 0))
+        
+        for endpoint, breaker in self.error_handler.circuit_breakers.items():
+            self.metrics.gauge('bot_api_circuit_open', 'Цепь эндпоинта API разомкнута (1) или нет (0)',
+                               endpoint=endpoint).set(int(breaker.state != breaker.CLOSED))
+    
+    async def _check_database(self):
+        """Проверка БД для /healthz: статус меняется только по результату запроса"""
+        try:
+            available = await asyncio.wait_for(self.async_db.ping(), timeout=5)
+        except asyncio.TimeoutError:
+            self.logger.error("❌ БД не ответила на проверку за 5с")
+            available = False
+        self.health_checker.update_db_status(available)
+    
+    async def run_ingestion(self):
+        """Цикл загрузки данных из API с учетом результата в HealthChecker"""
+        summary = await self.ingestion.run()
+        self.health_checker.update_api_status(not summary['errors'])
+    
+    def _schedule_adaptive(self, name: str, func: Callable[[], Awaitable], timeout: float, first: float,
+                           cadence: Optional[str] = None):
+        """Задача, которая после каждого запуска сама планирует следующий по MatchDayScheduler
+        
+        cadence - ключ интервала в CADENCE, по умолчанию совпадает с именем задачи.
+        """
+        run = self.job_runner.job(name, func, timeout)
+        cadence = cadence or name
+        
+        async def callback(context: ContextTypes.DEFAULT_TYPE):
+            # JobRunner сам обрабатывает ошибки и таймауты, поэтому следующий запуск планируется всегда
+            await run(context)
+            await self.match_scheduler.refresh()
+            context.job_queue.run_once(callback, when=self.match_scheduler.next_delay(cadence), name=name)
+        
+        # После перезапуска недавно выполненная задача ждет остаток интервала
+        first = self.job_runner.first_delay(name, self.match_scheduler.next_delay(cadence), default=first)
+        self.app.job_queue.run_once(callback, when=first, name=name)
+    
+    def _schedule_at(self, name: str, func: Callable[[], Awaitable], timeout: float, at: str,
+                     weekday: Optional[int] = None, grace: timedelta = timedelta(hours=3)):
+        """Задача по расписанию (ежедневно или раз в неделю) с догоном пропущенного запуска
+        
+        weekday: 0 - понедельник, как в datetime.weekday(). Если бот был
+        остановлен в момент запуска и с тех пор прошло не больше grace,
+        задача выполняется сразу после старта; более старый пропуск
+        не догоняется, чтобы не публиковать устаревшее.
+        """
+        at_time = datetime.strptime(at, "%H:%M").time()
+        callback = self.job_runner.job(name, func, timeout)
+        
+        if weekday is None:
+            self.app.job_queue.run_daily(callback, time=at_time, name=name)
+        else:
+            # В JobQueue дни недели считаются с воскресенья (0=Sunday, 1=Monday, ..., 6=Saturday)
+            self.app.job_queue.run_daily(callback, time=at_time, days=((weekday + 1) % 7,), name=name)
+        
+        scheduled_at = JobRunner.last_occurrence(at_time, weekday)
+        action = self.job_runner.missed_run_action(name, scheduled_at, grace)
+        if action == 'catch_up':
+            self.logger.info(f"⏪ Догоняем пропущенный запуск {name} ({scheduled_at:%d.%m %H:%M})")
+            self.app.job_queue.run_once(callback, when=15, name=f"{name}_catch_up")
+        elif action == 'skip':
+            self.logger.info(f"⏭️ Пропущенный запуск {name} ({scheduled_at:%d.%m %H:%M}) слишком старый")
 
     async def setup_scheduled_jobs(self):
         """Настройка запланированных задач"""
         job_queue = self.app.job_queue
         
-        # Срочные новости каждые 15 минут
-        job_queue.run_repeating(
-            lambda context: asyncio.create_task(self.send_urgent_news()),
-            interval=900,  # 15 минут
-            first=60,
-            name="urgent_news"
-        )
+        # Время последних запусков задач до перезапуска
+        await self.job_runner.load()
         
-        # Полные новости каждые 30 минут
-        job_queue.run_repeating(
-            lambda context: asyncio.create_task(self.send_full_news()),
-            interval=1800,  # 30 минут
-            first=120,
-            name="full_news"
-        )
+        # Срочные и полные новости: частота зависит от фазы игрового дня
+        await self.match_scheduler.refresh()
+        self._schedule_adaptive('urgent_news', self.send_urgent_news, timeout=300, first=60)
+        self._schedule_adaptive('full_news', self.send_full_news, timeout=900, first=120)
+        
+        # Опрос API: матчи, команды, таблица и бомбардиры; без ключа API не запускается
+        if self.api_client.api_key:
+            self._schedule_adaptive('ingestion', self.run_ingestion, timeout=120, first=30, cadence='poll')
+        else:
+            self.logger.warning("⚠️ API_FOOTBALL_KEY не задан, загрузка данных из API отключена")
         
         # Ежедневное расписание в 9:00
-        job_queue.run_daily(
-            lambda context: asyncio.create_task(self.send_daily_schedule()),
-            time=datetime.strptime("09:00", "%H:%M").time(),
-            name="daily_schedule"
-        )
+        self._schedule_at('daily_schedule', self.send_daily_schedule, timeout=300, at="09:00")
         
         # Еженедельная таблица в понедельник в 10:00
-        job_queue.run_daily(
-            lambda context: asyncio.create_task(self.send_weekly_table()),
-            time=datetime.strptime("10:00", "%H:%M").time(),
-            days=(0,),  # Понедельник (0=Sunday, 1=Monday, ..., 6=Saturday)
-            name="weekly_table"
-        )        
+        self._schedule_at('weekly_table', self.send_weekly_table, timeout=300, at="10:00",
+                          weekday=0, grace=timedelta(hours=12))
+        
+        # Прогрев кэша изображения таблицы после запуска
+        job_queue.run_once(
+            self.job_runner.job('league_table_prewarm', self.warm_league_table_image, timeout=60),
+            when=5,
+            name="league_table_prewarm"
+        )
+        
+        # Досылка отложенных сообщений outbox каждую минуту
+        job_queue.run_repeating(
+            self.job_runner.job('outbox_drain', self.drain_outbox, timeout=900),
+            interval=60,
+            first=10,
+            name="outbox_drain"
+        )
+        
         self.logger.info("✅ Запланированные задачи настроены")
 
     async def run_bot(self):
@@ -605,8 +869,7 @@ class UltimateMatchTVBot:
             self.logger.info("   • Максимально частые обновления")
             self.logger.info("   • Стиль Матч ТВ")
             
-            # Настраиваем запланированные задачи
-            await self.setup_scheduled_jobs()
+            # Запланированные задачи настраиваются в _on_startup (post_init приложения)
             
             # Отправляем стартовое сообщение
             start_message = """🚀 SAUDI FOOTBALL TV BOT ЗАПУЩЕН!
@@ -639,7 +902,15 @@ class UltimateMatchTVBot:
 def main():
     """Главная функция"""
     bot = UltimateMatchTVBot()
-    bot.app.run_polling(drop_pending_updates=True)
+    try:
+        bot.app.run_polling(drop_pending_updates=True)
+    finally:
+        # Ошибка одного шага не должна помешать закрыть остальное
+        for close in (bot.render_pool.shutdown, bot.async_db.close, bot.db_manager.close):
+            try:
+                close()
+            except Exception as e:
+                bot.logger.error(f"❌ Ошибка при остановке: {e}")
 
 if __name__ == "__main__":
     main()